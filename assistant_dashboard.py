@@ -12,6 +12,7 @@ import json
 import re
 from openai import OpenAI
 from code_editor import code_editor
+from assistant_registry import assistant_registry_cache
 
 load_dotenv()
 
@@ -46,11 +47,14 @@ def create_or_update_assistant(assistant_id, assistant_name, document_body):
     else:  # Create new assistant
         es.index(index=index_name, document=document_body)
         st.success("Assistant created successfully!")
+    # The ingestion pipeline caches assistant lookups, the shared stamp makes it drop them
+    assistant_registry_cache.invalidate()
 
 
 def delete_assistant(a_id,assistant_id):
     """Delete an assistant from Elasticsearch."""
     es.delete(index=index_name, id=a_id)
+    assistant_registry_cache.invalidate()
     response = client.beta.assistants.delete(assistant_id)
     st.write(response)
     st.success("Assistant deleted successfully.")
@@ -135,6 +139,7 @@ def assistant_form(a_id, assistants, category):
             name=assistant_name,
             instructions=response_dict['text'],
             tools=[{"type": "retrieval"}],
+            file_ids=[],
             model="gpt-4-turbo-preview",
         )
     else:
@@ -144,6 +149,8 @@ def assistant_form(a_id, assistants, category):
             instructions=response_dict['text'],
             name=assistant_name,
             tools=[{"type": "retrieval"}],
+            # Documents are attached to each extraction thread's message, none belong on the shared assistant
+            file_ids=[],
             model="gpt-4-turbo-preview", )
 
     document = {
@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+
+ASSISTANT_REGISTRY_TTL = int(os.getenv("ASSISTANT_REGISTRY_TTL", 300))  # seconds
+# Touched on every change to the registry, so caches in other processes (dashboard vs. pipeline) notice it
+ASSISTANT_REGISTRY_STAMP = os.getenv("ASSISTANT_REGISTRY_STAMP", ".cache/assistant_registry.stamp")
+
+
+class AssistantRegistryCache:
+    """
+    In-process cache of assistant registry lookups by assistant name.
+
+    Entries expire after `ttl` seconds. Writers call `invalidate`, which also touches a stamp file
+    shared by every process; a cache that sees a newer stamp drops all its entries.
+    """
+
+    def __init__(self, ttl=ASSISTANT_REGISTRY_TTL, stamp_path=ASSISTANT_REGISTRY_STAMP):
+        self.ttl = ttl
+        self.stamp_path = stamp_path
+        self._entries = {}  # assistant name -> (expires_at, matching assistants)
+        self._stamp = self._read_stamp()
+        self._lock = threading.Lock()
+
+    def _read_stamp(self):
+        try:
+            return os.stat(self.stamp_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def get(self, assistant_name):
+        stamp = self._read_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                self._entries.clear()
+                self._stamp = stamp
+            entry = self._entries.get(assistant_name)
+            if entry is None:
+                return None
+            expires_at, assistants = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[assistant_name]
+                return None
+            return assistants
+
+    def put(self, assistant_name, assistants):
+        with self._lock:
+            self._entries[assistant_name] = (time.monotonic() + self.ttl, assistants)
+
+    def invalidate(self, assistant_name=None):
+        """Drop one assistant, or every cached assistant when no name is given, in every process."""
+        directory = os.path.dirname(self.stamp_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.stamp_path, "a"):
+            os.utime(self.stamp_path)
+        with self._lock:
+            if assistant_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(assistant_name, None)
+
+
+assistant_registry_cache = AssistantRegistryCache()
@@ -0,0 +1,168 @@
+import glob
+import os
+import shutil
+import tempfile
+
+import ffmpeg
+import numpy as np
+
+# Whisper rejects uploads over 25 MB, keep a margin for container overhead
+TRANSCRIPTION_SEGMENT_BYTES = int(os.getenv("TRANSCRIPTION_SEGMENT_BYTES", 24 * 1024 * 1024))
+SEGMENT_BITRATE = 64000  # bits per second of the mono MP3 segments sent for transcription
+ANALYSIS_SAMPLE_RATE = 8000  # plenty to find pauses in speech
+ANALYSIS_FRAME_SECONDS = 0.05
+SILENCE_SEARCH_SECONDS = 30  # how far before the target length a boundary may be moved
+SILENCE_SMOOTHING_SECONDS = 0.3
+TRANSCRIPTION_SAMPLE_RATE = 16000  # Whisper resamples to 16 kHz mono, more only makes files bigger
+EXTRACTED_AUDIO_BITRATE = int(os.getenv("EXTRACTED_AUDIO_BITRATE", 48000))
+EXTRACTED_AUDIO_CODEC = os.getenv("EXTRACTED_AUDIO_CODEC", "mp3")  # mp3 or opus
+
+# ffmpeg encoder and file extension of each extracted audio format
+audio_codecs = {
+    "mp3": ("libmp3lame", ".mp3"),
+    "opus": ("libopus", ".ogg"),
+}
+
+
+def frame_energies(audio_path, sample_rate=ANALYSIS_SAMPLE_RATE, frame_seconds=ANALYSIS_FRAME_SECONDS,
+                   frames_per_read=2000):
+    """
+    Return the RMS energy (dBFS) of consecutive frames of the audio track and its duration in seconds.
+    The track is decoded to low-rate mono PCM and read in blocks, so memory does not grow with its length.
+    """
+    frame_size = int(sample_rate * frame_seconds)
+    block_bytes = frame_size * frames_per_read * 2  # 16-bit samples
+
+    process = (
+        ffmpeg
+        .input(audio_path)
+        .output("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=sample_rate)
+        .run_async(pipe_stdout=True, quiet=True)
+    )
+
+    energies = []
+    total_samples = 0
+    remainder = b""
+    try:
+        while True:
+            block = process.stdout.read(block_bytes)
+            if not block:
+                break
+            block = remainder + block
+            usable = len(block) - len(block) % (frame_size * 2)
+            remainder = block[usable:]
+            samples = np.frombuffer(block[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+            total_samples += samples.size
+            frames = samples.reshape(-1, frame_size)
+            energies.append(np.sqrt(np.mean(frames ** 2, axis=1)))
+    finally:
+        process.stdout.close()
+        process.wait()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {audio_path}")
+
+    total_samples += len(remainder) // 2
+    rms = np.concatenate(energies) if energies else np.zeros(0, dtype=np.float32)
+    return 20 * np.log10(rms + 1e-10), total_samples / sample_rate
+
+
+def extract_audio_track(video_path, output_base, codec=EXTRACTED_AUDIO_CODEC, bitrate=EXTRACTED_AUDIO_BITRATE,
+                        sample_rate=TRANSCRIPTION_SAMPLE_RATE):
+    """
+    Write only the audio track of a video as compact mono audio ready for transcription, in a single
+    ffmpeg pass that never decodes the video frames. Returns the path, `output_base` plus the codec's extension.
+    """
+    encoder, extension = audio_codecs[codec]
+    output_path = output_base + extension
+    (
+        ffmpeg
+        .input(video_path)
+        .output(output_path, vn=None, sn=None, ac=1, ar=sample_rate, acodec=encoder, audio_bitrate=bitrate)
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return output_path
+
+
+def max_segment_seconds(byte_budget=TRANSCRIPTION_SEGMENT_BYTES, bitrate=SEGMENT_BITRATE):
+    return byte_budget * 8 / bitrate
+
+
+def plan_boundaries(energies, duration, max_seconds, frame_seconds=ANALYSIS_FRAME_SECONDS,
+                    search_seconds=SILENCE_SEARCH_SECONDS, smoothing_seconds=SILENCE_SMOOTHING_SECONDS):
+    """
+    Choose cut points so that no segment is longer than `max_seconds`, moving each cut back to the
+    quietest moment within `search_seconds` of the limit so words are not split.
+    Returns the list of cut times in seconds (excluding 0 and the end of the track).
+    """
+    if energies.size == 0:
+        return []  # shorter than one analysis frame
+    search_seconds = min(search_seconds, max_seconds / 2)
+    smoothing_frames = max(1, int(smoothing_seconds / frame_seconds))
+    smoothed = np.convolve(energies, np.ones(smoothing_frames) / smoothing_frames, mode="same")
+
+    cuts = []
+    start = 0.0
+    while duration - start > max_seconds:
+        window_end = int((start + max_seconds) / frame_seconds)
+        window_start = int((start + max_seconds - search_seconds) / frame_seconds)
+        window = smoothed[window_start:window_end]
+        if window.size:
+            # Latest quietest frame, keeping segments as long as the budget allows
+            quietest = window.size - 1 - int(np.argmin(window[::-1]))
+            cut = round((window_start + quietest) * frame_seconds, 3)
+        else:
+            cut = start + max_seconds
+        cuts.append(cut)
+        start = cut
+    return cuts
+
+
+def cut_segments(audio_path, cuts, output_dir, bitrate=SEGMENT_BITRATE):
+    """Cut the track at the given times into mono MP3 segments in `output_dir` in a single streaming ffmpeg pass."""
+    segment_pattern = os.path.join(output_dir, "segment_%03d.mp3")
+
+    output_args = {
+        "f": "segment",
+        "reset_timestamps": 1,
+        "vn": None,
+        "ac": 1,
+        "acodec": "libmp3lame",
+        "audio_bitrate": bitrate,
+    }
+    if cuts:
+        output_args["segment_times"] = ",".join(f"{cut:.3f}" for cut in cuts)
+    else:
+        # One segment covering the whole track
+        output_args["segment_time"] = 10 ** 9
+
+    ffmpeg.input(audio_path).output(segment_pattern, **output_args).overwrite_output().run(quiet=True)
+
+    return sorted(glob.glob(os.path.join(glob.escape(output_dir), "segment_[0-9][0-9][0-9].mp3")))
+
+
+def segment_audio(audio_path, max_seconds=None, byte_budget=TRANSCRIPTION_SEGMENT_BYTES):
+    """
+    Split an audio (or video) file into transcription-sized MP3 segments cut at pauses.
+
+    Segments stay under `byte_budget` bytes and, when given, `max_seconds` seconds. They are written
+    to a new temporary directory, which the caller removes once done with them.
+    Returns a list of {"path", "start", "end"} dicts in playback order, times in seconds.
+    """
+    limit = max_segment_seconds(byte_budget)
+    if max_seconds is not None:
+        limit = min(limit, max_seconds)
+
+    energies, duration = frame_energies(audio_path)
+    cuts = plan_boundaries(energies, duration, limit)
+    # A fresh directory per call, so segments left behind by an interrupted run are never picked up
+    output_dir = tempfile.mkdtemp(prefix="segments-")
+    try:
+        paths = cut_segments(audio_path, cuts, output_dir)
+    except BaseException:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+
+    bounds = [0.0] + cuts + [duration]
+    return [{"path": path, "start": bounds[i], "end": bounds[i + 1]} for i, path in enumerate(paths)]
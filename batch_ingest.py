@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from progress_reporter import ProgressReporter
+
+BATCH_INGEST_WORKERS = int(os.getenv("BATCH_INGEST_WORKERS", os.getenv("BULK_INGEST_WORKERS", 4)))
+BATCH_INGEST_REPORT = os.getenv("BATCH_INGEST_REPORT", "ingestion_report.jsonl")
+
+file_types = {
+    ".txt": "Text", ".pdf": "Text", ".docx": "Text",
+    ".mp3": "Audio", ".wav": "Audio",
+    ".mp4": "Video", ".mov": "Video", ".avi": "Video",
+}
+
+
+def read_manifest(manifest_path):
+    """
+    Read the files to ingest: one path per line, or one JSON object per line with "path" and
+    optionally "type" (Text, Audio or Video) and "name". Blank lines and # comments are ignored.
+    """
+    entries = []
+    with open(manifest_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line) if line.startswith("{") else {"path": line}
+            entry.setdefault("type", file_types.get(os.path.splitext(entry["path"])[1].lower()))
+            entry.setdefault("name", os.path.basename(entry["path"]))
+            entries.append(entry)
+    return entries
+
+
+def completed_paths(report_path):
+    """Paths an earlier run of the same report already indexed or skipped."""
+    done = set()
+    if not os.path.exists(report_path):
+        return done
+    with open(report_path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interrupted run
+            if result["status"] != "failed":
+                done.add(result["path"])
+    return done
+
+
+class CountingReporter(ProgressReporter):
+    """Prefixes the pipeline's messages with the position of the file in the batch."""
+
+    def __init__(self, position, total):
+        self.prefix = f"[{position}/{total}] "
+
+    def write(self, message):
+        super().write(self.prefix + str(message))
+
+    def info(self, message):
+        super().info(self.prefix + str(message))
+
+    def success(self, message):
+        super().success(self.prefix + str(message))
+
+    def error(self, message):
+        super().error(self.prefix + str(message))
+
+
+def ingest_entry(pipeline, entry, reporter, dedup_policy, output_dir, work_dir):
+    if entry["type"] == "Text":
+        return pipeline.process_and_index_files(entry["path"], entry["name"], pipeline.document_index, "Text",
+                                                "Meta Doc Creator", dedup_policy=dedup_policy, reporter=reporter)
+    text_folder = os.path.join(output_dir, "Transcripts")
+    if entry["type"] == "Audio":
+        return pipeline.ingest_audio_file(entry["path"], video_folder=work_dir, text_folder=text_folder,
+                                          dedup_policy=dedup_policy, reporter=reporter)
+    if entry["type"] == "Video":
+        return pipeline.ingest_video_file(entry["path"], audio_folder=work_dir, text_folder=text_folder,
+                                          dedup_policy=dedup_policy, reporter=reporter)
+    raise ValueError(f"Unsupported file type {entry['type']!r} for {entry['path']}")
+
+
+def run_entry(pipeline, entry, position, total, dedup_policy, output_dir, work_dir):
+    reporter = CountingReporter(position, total)
+    started = time.monotonic()
+    result = {"path": entry["path"], "type": entry["type"]}
+    try:
+        # Extracted audio and rendered video of files with the same name must not collide either
+        with tempfile.TemporaryDirectory(dir=work_dir) as entry_dir:
+            state = ingest_entry(pipeline, entry, reporter, dedup_policy, output_dir, entry_dir)
+        if state.get("error") or state.get("index_error"):
+            result.update(status="failed", error=state.get("error") or state.get("index_error"))
+        else:
+            result.update(status="skipped" if state.get("skipped") else "indexed",
+                          document_id=state.get("document_id"), version=state.get("version"))
+    except Exception as e:
+        traceback.print_exc()
+        reporter.error(f"Error processing {entry['name']}: {e}")
+        result.update(status="failed", error=f"{type(e).__name__}: {e}")
+    result["seconds"] = round(time.monotonic() - started, 3)
+    result["finished_at"] = datetime.now(timezone.utc).isoformat()
+    return result
+
+
+def run_batch(entries, report_path=BATCH_INGEST_REPORT, workers=BATCH_INGEST_WORKERS, dedup_policy=None,
+              output_dir="IKMS Data Repo"):
+    """Ingest the entries on a thread pool, appending one JSON result per file to the report as it finishes."""
+    import data_ingestion_pipeline as pipeline
+
+    pipeline.setup_directories(output_dir)
+    counts = {"indexed": 0, "skipped": 0, "failed": 0}
+    with open(report_path, "a") as report, tempfile.TemporaryDirectory() as work_dir, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_entry, pipeline, entry, position, len(entries), dedup_policy, output_dir,
+                                   work_dir)
+                   for position, entry in enumerate(entries, start=1)]
+        for future in as_completed(futures):
+            result = future.result()
+            counts[result["status"]] += 1
+            report.write(json.dumps(result) + "\n")
+            report.flush()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a manifest of files without the Streamlit app.")
+    parser.add_argument("manifest", help="file with one path, or one JSON object with a path, per line")
+    parser.add_argument("--report", default=BATCH_INGEST_REPORT, help="JSONL file the results are appended to")
+    parser.add_argument("--workers", type=int, default=BATCH_INGEST_WORKERS, help="files ingested in parallel")
+    parser.add_argument("--dedup-policy", choices=["skip", "replace", "version"],
+                        help="what to do with documents whose content is already indexed")
+    parser.add_argument("--output-dir", default="IKMS Data Repo",
+                        help="transcripts are written to its Transcripts sub folder")
+    parser.add_argument("--resume", action="store_true",
+                        help="leave out files the report already lists as indexed or skipped")
+    args = parser.parse_args()
+
+    entries = read_manifest(args.manifest)
+    if args.resume:
+        done = completed_paths(args.report)
+        entries = [entry for entry in entries if entry["path"] not in done]
+
+    started = time.monotonic()
+    counts = run_batch(entries, args.report, args.workers, args.dedup_policy, args.output_dir)
+    print(f"Finished {len(entries)} files in {time.monotonic() - started:.1f}s: "
+          f"{counts['indexed']} indexed, {counts['skipped']} skipped, {counts['failed']} failed. "
+          f"Results in {args.report}")
+    import data_ingestion_pipeline as pipeline
+
+    print(pipeline.run_wait_summary())
+
+
+if __name__ == "__main__":
+    main()
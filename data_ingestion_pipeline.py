@@ -9,15 +9,30 @@ import pandas as pd
 import os
 import getpass
 import openai
+import ffmpeg
 import time
 import json
 import re
+import random
+from datetime import datetime, timezone
+import threading
+import tempfile
 from openai import OpenAI
 from pathlib import Path
 from pytube import YouTube
 from moviepy.editor import VideoFileClip
-from pydub import AudioSegment
 from videodb import connect, play_stream
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from audio_segmentation import EXTRACTED_AUDIO_BITRATE, TRANSCRIPTION_SAMPLE_RATE, extract_audio_track, segment_audio
+from file_hashing import hash_file
+from vocabulary_cache import VocabularyCache
+from transcript_cache import TranscriptCache
+from job_queue import JobQueue
+from es_bulk_indexer import BulkIndexer
+from assistant_registry import assistant_registry_cache
+from ingestion_registry import ContentHashRegistry
+from progress_reporter import StreamlitReporter
+from upload_store import persist_upload
 
 load_dotenv()
 
@@ -27,12 +42,29 @@ document_index = "meta-summary-registry"
 
 openai.api_key = os.environ["OPENAI_API_KEY"]
 
+TRANSCRIPTION_CONCURRENCY = int(os.getenv("TRANSCRIPTION_CONCURRENCY", 4))
+TRANSCRIPTION_RETRIES = int(os.getenv("TRANSCRIPTION_RETRIES", 3))
+BULK_INGEST_WORKERS = int(os.getenv("BULK_INGEST_WORKERS", 4))
+BULK_INGEST_RETRIES = int(os.getenv("BULK_INGEST_RETRIES", 3))
+RATE_LIMIT_COOLDOWN = float(os.getenv("RATE_LIMIT_COOLDOWN", 5))  # seconds
+RUN_POLL_INITIAL = float(os.getenv("RUN_POLL_INITIAL", 0.5))  # seconds
+RUN_POLL_MAX = float(os.getenv("RUN_POLL_MAX", 8))  # seconds
+RUN_TIMEOUT = float(os.getenv("RUN_TIMEOUT", 600))  # seconds
+DEDUP_POLICY = os.getenv("DEDUP_POLICY", "skip")  # skip, replace or version
+DEDUP_POLICIES = ["skip", "replace", "version"]
+TRANSCRIPT_FOLDER = "IKMS Data Repo/Transcripts"
+
 es = Elasticsearch(
     os.getenv('ES_END_POINT'),  # Elasticsearch endpoint
     api_key=os.getenv('ES_API_KEY'),  # API key ID and secret
 )
 
 client = OpenAI()
+vocabulary_cache = VocabularyCache(es, document_index)
+transcript_cache = TranscriptCache()
+job_queue = JobQueue()
+content_registry = ContentHashRegistry()
+streamlit_reporter = StreamlitReporter()
 video_db_conn = connect(api_key=os.getenv('VIDEO_DB_API_KEY'))
 
 
@@ -79,7 +111,7 @@ def sanitize_filename(title):
     return sanitized
 
 
-def download_video(url, output_path):
+def download_video(url, output_path, reporter=None):
     yt = YouTube(url)
     video_title = sanitize_filename(yt.title)
     filename_with_extension = f"{video_title}.mp4"  # Include extension for clarity
@@ -88,7 +120,7 @@ def download_video(url, output_path):
     Path(output_path).mkdir(parents=True, exist_ok=True)
 
     file_path = os.path.join(output_path, filename_with_extension)  # Corrected to use filename with extension
-    st.write(output_path)
+    (reporter or streamlit_reporter).write(output_path)
     # Download the video
     yt.streams.get_highest_resolution().download(output_path=output_path,
                                                  filename=filename_with_extension)  # Keep filename without extension for download method
@@ -104,61 +136,101 @@ def download_video(url, output_path):
     return metadata
 
 
-def video_to_audio(video_path, output_folder):
-    st.write(video_path)
+def video_to_audio(video_path, output_folder, reporter=None):
+    (reporter or streamlit_reporter).write(video_path)
     video_title = os.path.splitext(os.path.basename(video_path))[0]
-    output_audio_path = os.path.join(output_folder, f"{sanitize_filename(video_title)}.wav")
+    output_base = os.path.join(output_folder, sanitize_filename(video_title))
+
+    # Only the audio track is decoded, straight to small mono 16 kHz audio
+    try:
+        return extract_audio_track(video_path, output_base)
+    except (ffmpeg.Error, OSError) as e:
+        print(f"ffmpeg audio extraction failed for {video_path}, falling back to moviepy: {e}")
 
+    output_audio_path = output_base + ".mp3"
     clip = VideoFileClip(video_path)
-    audio = clip.audio
-    audio.write_audiofile(output_audio_path)
+    try:
+        if clip.audio is None:
+            raise ValueError(f"{video_path} has no audio track")
+        clip.audio.write_audiofile(output_audio_path, fps=TRANSCRIPTION_SAMPLE_RATE, codec="libmp3lame",
+                                   bitrate=f"{EXTRACTED_AUDIO_BITRATE // 1000}k", ffmpeg_params=["-ac", "1"],
+                                   logger=None)
+    finally:
+        clip.close()
 
     return output_audio_path
 
 
-def split_audio(audio_path, segment_length=10 * 60 * 1000):
-    audio = AudioSegment.from_file(audio_path)
-    segments = []
-    base_audio_path = audio_path.rsplit(".", 1)[0]  # Removes file extension
+def split_audio(audio_path, segment_length=None):
+    # Segments stay under the Whisper upload limit and are cut at pauses instead of mid-word.
+    # The byte budget sets their length; segment_length (milliseconds) only caps it further.
+    max_seconds = segment_length / 1000 if segment_length is not None else None
+    segments = segment_audio(audio_path, max_seconds=max_seconds)
+    return [segment["path"] for segment in segments]
 
-    for i in range(0, len(audio), segment_length):
-        segment_path = f"{base_audio_path}_segment_{i // segment_length}.mp3"
-        audio[i:i + segment_length].export(segment_path, format="mp3")
-        segments.append(segment_path)
 
-    return segments
+def transcribe_segment(segment_path, retries=TRANSCRIPTION_RETRIES):
+    # Segments of a partially transcribed recording are not sent to Whisper again on retry
+    segment_hash = hash_file(segment_path)
+    cached_text = transcript_cache.get(segment_hash)
+    if cached_text is not None:
+        return cached_text
 
+    for attempt in range(retries + 1):
+        try:
+            with open(segment_path, "rb") as audio_file:
+                transcription = client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=audio_file
+                )
+            transcript_cache.put(segment_hash, transcription.text)
+            return transcription.text
+        except (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError) as e:
+            if attempt == retries:
+                raise
+            print(f"Transcription of {segment_path} failed ({e}), retrying")
+            time.sleep(2 ** attempt)
+
+
+def audio_to_text(audio_path, is_audio=False, concurrency=TRANSCRIPTION_CONCURRENCY, audio_hash=None):
+    audio_hash = audio_hash or hash_file(audio_path)
+    cached_text = transcript_cache.get(audio_hash)
+    if cached_text is not None:
+        if not is_audio:
+            os.remove(audio_path)
+        return cached_text
 
-def audio_to_text(audio_path, is_audio=False):
     segments = split_audio(audio_path)
-    combined_text = []
 
-    for segment_path in segments:
-        with open(segment_path, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
-            combined_text.append(transcription.text)
-
-    for segment_path in segments:
-        os.remove(segment_path)  # Clean up segment after processing
+    try:
+        # Segments are transcribed concurrently, map keeps the results in segment order
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            combined_text = list(executor.map(transcribe_segment, segments))
+    finally:
+        for segment_path in segments:
+            os.remove(segment_path)  # Clean up segment after processing
+        if segments:
+            os.rmdir(os.path.dirname(segments[0]))
+
+    text = " ".join(combined_text)
+    transcript_cache.put(audio_hash, text)
 
     # Optionally, clean up the original audio file after processing all segments
     if not is_audio:
         os.remove(audio_path)
 
-    return " ".join(combined_text)
+    return text
 
 
 def setup_directories(base_dir="IKMS Data Repo"):
     Path(base_dir).mkdir(parents=True, exist_ok=True)
-    sub_dirs = ["Image", "Text", "Video", "Audio"]
+    sub_dirs = ["Image", "Text", "Video", "Audio", "Transcripts"]
     for sub_dir in sub_dirs:
         Path(os.path.join(base_dir, sub_dir)).mkdir(parents=True, exist_ok=True)
 
 
 def save_uploaded_file(directory, file):
+    """Persist an upload once and return (file_path, sanitized_base_name, content_hash) for the later stages."""
     if file is not None:
         # Split the filename into base name and extension
         base_name, extension = os.path.splitext(file.name)
@@ -167,20 +239,93 @@ def save_uploaded_file(directory, file):
         # Combine the sanitized base name with the original extension
         new_file_name = sanitized_base_name + extension
         file_path = os.path.join(directory, new_file_name)
-        with open(file_path, "wb") as f:
-            f.write(file.getbuffer())
+        content_hash = persist_upload(file, file_path)
         st.success(f"Saved file: {new_file_name} in {directory}")
-        return file_path, sanitized_base_name
+        return file_path, sanitized_base_name, content_hash
     return None
 
 
-def wait_for_complete(run, thread, client):
-    while run.status == "queued" or run.status == "in_progress":
-        run = client.beta.threads.runs.retrieve(
-            thread_id=thread.id,
-            run_id=run.id,
-        )
-        time.sleep(0.5)
+class RateLimitGate:
+    """Shared pause that concurrent workers wait on after any of them was rate limited."""
+
+    def __init__(self):
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def trip(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def wait(self):
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+
+rate_limit_gate = RateLimitGate()
+
+
+run_wait_stats = {"runs": 0, "polls": 0, "wait_seconds": 0.0}
+run_wait_stats_lock = threading.Lock()
+
+
+def record_run_wait(run, polls, wait_seconds):
+    print(f"Run {run.id} ended {run.status} after {polls} polls and {wait_seconds:.1f}s")
+    with run_wait_stats_lock:
+        run_wait_stats["runs"] += 1
+        run_wait_stats["polls"] += polls
+        run_wait_stats["wait_seconds"] += wait_seconds
+
+
+def run_wait_summary(since=None):
+    """Describe the extraction runs waited for, all of them or those since an earlier copy of run_wait_stats."""
+    with run_wait_stats_lock:
+        stats = dict(run_wait_stats)
+    if since:
+        stats = {key: stats[key] - since[key] for key in stats}
+    if not stats["runs"]:
+        return "No extraction runs were waited for"
+    return (f'{stats["runs"]} extraction runs, {stats["polls"]} status polls, '
+            f'{stats["wait_seconds"] / stats["runs"]:.1f}s average wait')
+
+
+def wait_for_complete(run, thread, client, timeout=RUN_TIMEOUT, initial_delay=RUN_POLL_INITIAL,
+                      max_delay=RUN_POLL_MAX):
+    """
+    Poll a run until it reaches a terminal state, backing off exponentially between polls.
+    Raises TimeoutError after `timeout` seconds and RuntimeError if the run does not complete.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    delay = initial_delay
+    polls = 0
+    try:
+        while run.status in ("queued", "in_progress", "cancelling"):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                client.beta.threads.runs.cancel(thread_id=thread.id, run_id=run.id)
+                raise TimeoutError(f"Run {run.id} did not finish within {timeout} seconds")
+            # Jitter keeps concurrent extractions from polling in lockstep
+            time.sleep(min(delay / 2 + random.uniform(0, delay / 2), remaining))
+            delay = min(delay * 2, max_delay)
+
+            run = client.beta.threads.runs.retrieve(
+                thread_id=thread.id,
+                run_id=run.id,
+            )
+            polls += 1
+    finally:
+        record_run_wait(run, polls, time.monotonic() - started)
+
+    if run.status == "requires_action":
+        # Extraction assistants only use retrieval, there are no tool outputs to submit
+        client.beta.threads.runs.cancel(thread_id=thread.id, run_id=run.id)
+        raise RuntimeError(f"Run {run.id} requested tool outputs, which extraction does not provide")
+    if run.status != "completed":
+        raise RuntimeError(f"Run {run.id} ended with status {run.status}: {getattr(run, 'last_error', None)}")
     return run
 
 
@@ -252,6 +397,10 @@ def search_assistant_by_name(assistant_name, index_name):
     :param index_name: The name of the index to search within.
     :return: A list of matching assistants with the exact given name.
     """
+    cached_assistants = assistant_registry_cache.get(assistant_name)
+    if cached_assistants is not None:
+        return cached_assistants
+
     query = {
         "query": {
             "term": {
@@ -263,18 +412,28 @@ def search_assistant_by_name(assistant_name, index_name):
     try:
         response = es.search(index=index_name, body=query)
         hits = response['hits']['hits']
-        return [hit["_source"] for hit in hits]
+        assistants = [hit["_source"] for hit in hits]
+        if assistants:
+            assistant_registry_cache.put(assistant_name, assistants)
+        return assistants
     except Exception as e:
         print(f"An error occurred: {e}")
         return []
 
 
-def process_file(file_path, assistant_name):
+def upload_document(file_path):
+    with open(file_path, 'rb') as document:
+        file = client.files.create(
+            file=document,
+            purpose="assistants"
+        )
+    return file.id
 
-    file = client.files.create(
-        file=open(file_path, 'rb'),
-        purpose="assistants"
-    )
+
+def process_file(file_path, assistant_name, file_id=None):
+
+    if file_id is None:
+        file_id = upload_document(file_path)
 
     matching_assistants = search_assistant_by_name(assistant_name, assistant_index)
 
@@ -282,32 +441,28 @@ def process_file(file_path, assistant_name):
         print("Assistant not found.")
         return
 
-    assistant = client.beta.assistants.retrieve(matching_assistants[0]['assistant_id'])
-
+    # The registry document already holds the assistant definition, so the shared assistant is never
+    # retrieved or updated: the file is attached to this thread's message and the run carries the prompt
+    assistant_id = matching_assistants[0]['assistant_id']
     prompt = matching_assistants[0]['Prompt']
 
-    client.beta.assistants.update(
-        matching_assistants[0]['assistant_id'],
-        instructions=prompt,
-        name=assistant.name,
-        tools=[{"type": "retrieval"}],
-        model="gpt-4-turbo-preview",
-        file_ids=[file.id],
-    )
-
     thread = client.beta.threads.create()
 
     client.beta.threads.messages.create(
         thread_id=thread.id,
         role="user",
         content="Extract",
+        file_ids=[file_id],
     )
 
     # Implement wait_for_complete and process_replies functions as before
 
     run = client.beta.threads.runs.create(
         thread_id=thread.id,
-        assistant_id=assistant.id,
+        assistant_id=assistant_id,
+        instructions=prompt,
+        tools=[{"type": "retrieval"}],
+        model="gpt-4-turbo-preview",
     )
 
     wait_for_complete(run, thread, client)
@@ -324,75 +479,318 @@ def process_file(file_path, assistant_name):
 
 
 def get_unique_sys_keywords():
-    keywords_query = {
-        "size": 0,
-        "aggs": {
-            "nested_metadata": {
-                "nested": {
-                    "path": "Metadata"
-                },
-                "aggs": {
-                    "unique_doc_keywords": {
-                        "terms": {
-                            "field": "Metadata.DOC_Keywords",
-                            "size": 10000
-                        }
-                    }
-                }
-            }
-        }
-    }
-
-    keywords_response = es.search(index=document_index, body=keywords_query)
-    # Extract the list of unique document keywords from the response
-    unique_sys_keywords = [bucket['key'] for bucket in
-                           keywords_response['aggregations']['nested_metadata']['unique_doc_keywords']['buckets']]
-
+    unique_sys_keywords, _ = vocabulary_cache.get()
     return unique_sys_keywords
 
 
 def get_unique_sys_domains():
-    domains_query = {
-        "size": 0,
-        "aggs": {
-            "nested_metadata": {
-                "nested": {
-                    "path": "Metadata"
-                },
-                "aggs": {
-                    "unique_domains": {
-                        "terms": {
-                            "field": "Metadata.Domain.keyword",
-                            "size": 10000
-                        }
-                    }
-                }
-            }
-        }
+    _, unique_sys_domains = vocabulary_cache.get()
+    return unique_sys_domains
+
+
+def build_document(parsed_json, file_path, file_name, file_type, file_id, vedio_id=None, file_loc=None,
+                   content_hash=None, version=1, previous_version_id=None, media_hash=None):
+    document = dict(parsed_json)
+    document['Document Source'] = file_path
+    document['Document Name'] = file_name
+    document['Data Type'] = file_type
+    document['File Id'] = file_id
+    document['Content Hash'] = content_hash or hash_file(file_path)
+    if media_hash is not None:
+        document['Media Hash'] = media_hash  # Hash of the recording a transcript was made from
+    document['Version'] = version
+    if previous_version_id is not None:
+        document['Previous Version Id'] = previous_version_id
+    document['Indexed At'] = datetime.now(timezone.utc).isoformat()
+    if vedio_id is not None:
+        document[file_type + ' Source'] = file_loc
+        document['Video Id'] = vedio_id  # Only add if vedio_id is provided
+    return document
+
+
+def index_document(index, document, doc_id=None):
+    # Index the document into Elasticsearch, an existing id replaces that document
+    response = es.index(index=index, id=doc_id, document=document)
+    vocabulary_cache.invalidate()
+    return response['_id']
+
+
+def find_indexed_document(index, content_hash, field="Content Hash"):
+    """Return {"document_id", "version"} of the latest document indexed with this content, or None."""
+    known = content_registry.lookup(content_hash)
+    if known:
+        if es.exists(index=index, id=known["document_id"]):
+            return {"document_id": known["document_id"], "version": known["version"]}
+        content_registry.forget(content_hash)  # Deleted from the index since it was recorded
+
+    query = {
+        "size": 1,
+        "_source": ["Version"],
+        "query": {"term": {f"{field}.keyword": content_hash}},
+        "sort": [{"Version": {"order": "desc", "unmapped_type": "long", "missing": "_last"}}]
+    }
+    hits = es.search(index=index, body=query)['hits']['hits']
+    if not hits:
+        return None
+    version = hits[0]['_source'].get('Version', 1)
+    content_registry.record(content_hash, hits[0]['_id'], version)
+    return {"document_id": hits[0]['_id'], "version": version}
+
+
+def ingestion_state(file_path, file_name, index, file_type, assistant_name, vedio_id=None, file_loc=None,
+                    dedup_policy=None, content_hash=None, media_hash=None):
+    return {
+        "file_path": file_path,
+        "file_name": file_name,
+        "index": index,
+        "file_type": file_type,
+        "assistant_name": assistant_name,
+        "vedio_id": vedio_id,
+        "file_loc": file_loc,
+        "dedup_policy": dedup_policy or DEDUP_POLICY,
+        "content_hash": content_hash,
+        "media_hash": media_hash,
     }
 
-    domains_response = es.search(index=document_index, body=domains_query)
 
-    # Extract the list of unique domains from the response
-    unique_sys_domains = [bucket['key'] for bucket in
-                          domains_response['aggregations']['nested_metadata']['unique_domains']['buckets']]
-    return unique_sys_domains
+def record_indexed(state):
+    content_registry.record(state["content_hash"], state["document_id"], state["version"], state["file_path"])
+    if state.get("media_hash"):
+        content_registry.record(state["media_hash"], state["document_id"], state["version"], state["file_loc"])
 
 
-def process_and_index_files(file_path, file_name, index, file_type, assistant_name, vedio_id=None, file_loc=None):
+def skip_indexed_media(media_path, file_type, media_hash, dedup_policy=None, reporter=None):
+    """
+    With the "skip" policy, return the skipped ingestion state of a recording that is already indexed,
+    checked before any rendering, transcription or VideoDB upload. Returns None when it has to be ingested.
+    """
+    state = ingestion_state(media_path, os.path.basename(media_path), document_index, file_type,
+                            "Meta Transcript Creator", file_loc=media_path, dedup_policy=dedup_policy,
+                            media_hash=media_hash)
+    if state["dedup_policy"] != "skip":
+        return None
+    duplicate = find_indexed_document(document_index, media_hash, field="Media Hash")
+    if duplicate is None:
+        return None
+    state.update(duplicate_of=duplicate, skipped=True, document_id=duplicate["document_id"])
+    (reporter or streamlit_reporter).info(f"Skipped {state['file_name']}, this recording is already indexed")
+    return state
+
+
+def run_ingestion_stages(state, checkpoint=None, indexer=None):
+    """
+    Upload, extract and index one document described by an ingestion_state dict.
+    The results of finished stages are stored in `state`, so running it again resumes after the last one.
+    With a BulkIndexer the document is only queued for indexing and `state` is its result context.
+
+    Content that is already indexed is handled by the state's dedup policy before anything is uploaded:
+    "skip" stops here, "replace" overwrites the existing document and "version" indexes a new version.
+    """
+    if "duplicate_of" not in state:
+        state["content_hash"] = state.get("content_hash") or hash_file(state["file_path"])
+        state["duplicate_of"] = find_indexed_document(state["index"], state["content_hash"])
+        if checkpoint:
+            checkpoint("dedup", state)
+
+    duplicate = state["duplicate_of"]
+    if duplicate and state["dedup_policy"] == "skip":
+        state["skipped"] = True
+        state["document_id"] = duplicate["document_id"]
+        return state
+
+    if not state.get("file_id"):
+        # Keep the uploaded file so the chat app can attach it without uploading the document again
+        state["file_id"] = upload_document(state["file_path"])
+        if checkpoint:
+            checkpoint("upload", state)
+
+    if state.get("metadata") is None:
+        metadata = process_file(state["file_path"], state["assistant_name"], file_id=state["file_id"])
+        if metadata is None:
+            raise RuntimeError(f"Metadata extraction failed for {state['file_name']}")
+        state["metadata"] = metadata
+        if checkpoint:
+            checkpoint("extract", state)
+
+    if not state.get("document_id") and not state.get("index_queued"):
+        doc_id, previous_version_id, state["version"] = None, None, 1
+        if duplicate and state["dedup_policy"] == "replace":
+            doc_id, state["version"] = duplicate["document_id"], duplicate["version"]
+        elif duplicate:
+            previous_version_id, state["version"] = duplicate["document_id"], duplicate["version"] + 1
+
+        document = build_document(state["metadata"],
+                                  state["file_path"],
+                                  state["file_name"],
+                                  state["file_type"],
+                                  state["file_id"],
+                                  vedio_id=state.get("vedio_id"),
+                                  file_loc=state.get("file_loc"),
+                                  content_hash=state["content_hash"],
+                                  version=state["version"],
+                                  previous_version_id=previous_version_id,
+                                  media_hash=state.get("media_hash"))
+        if indexer is not None:
+            indexer.add(document, doc_id=doc_id, context=state)
+            state["index_queued"] = True
+            return state
+        state["document_id"] = index_document(state["index"], document, doc_id=doc_id)
+        record_indexed(state)
+        if checkpoint:
+            checkpoint("index", state)
+
+    return state
+
+
+def ingest_with_backoff(state, retries=BULK_INGEST_RETRIES, indexer=None):
+    for attempt in range(retries + 1):
+        rate_limit_gate.wait()
+        try:
+            return run_ingestion_stages(state, indexer=indexer)
+        except openai.RateLimitError:
+            if attempt == retries:
+                raise
+            # Pause every bulk worker, not just this one, the limit is shared by the whole API key
+            rate_limit_gate.trip(RATE_LIMIT_COOLDOWN * 2 ** attempt)
+
+
+def bulk_indexer_for(index):
+    """BulkIndexer that records document ids in the ingestion states and refreshes the vocabulary."""
+    def record_result(state, ok, item):
+        if ok:
+            state["document_id"] = item["index"]["_id"]
+            record_indexed(state)
+        else:
+            state["index_error"] = str(item.get("index", item).get("error"))
+
+    return BulkIndexer(es, index,
+                       on_result=record_result,
+                       on_flush=lambda results: vocabulary_cache.invalidate())
+
+
+def process_and_index_files(file_path, file_name, index, file_type, assistant_name, vedio_id=None, file_loc=None,
+                            dedup_policy=None, reporter=None, content_hash=None, media_hash=None):
+    """Ingest one document and return its ingestion state; failures are reported and kept in state["error"]."""
+    reporter = reporter or streamlit_reporter
+    state = ingestion_state(file_path, file_name, index, file_type, assistant_name,
+                            vedio_id=vedio_id, file_loc=file_loc, dedup_policy=dedup_policy,
+                            content_hash=content_hash, media_hash=media_hash)
     try:
-        parsed_json = process_file(file_path, assistant_name)
-        parsed_json['Document Source'] = file_path
-        parsed_json['Document Name'] = file_name
-        parsed_json['Data Type'] = file_type
-        if vedio_id is not None:
-            parsed_json[file_type + ' Source'] = file_loc
-            parsed_json['Video Id'] = vedio_id  # Only add if vedio_id is provided
-        # Index the document into Elasticsearch
-        es.index(index=index, document=parsed_json)
-        st.write(f"Processed and indexed {file_name}")
+        ingest_with_backoff(state)
+        if state.get("skipped"):
+            reporter.info(f"Skipped {file_name}, the same content is already indexed")
+        else:
+            reporter.write(f"Processed and indexed {file_name}")
     except Exception as e:
-        st.error(f"Error processing {file_name}: {str(e)}")
+        state["error"] = f"{type(e).__name__}: {e}"
+        reporter.error(f"Error processing {file_name}: {str(e)}")
+    return state
+
+
+def write_transcript(title, text_data, media_hash, text_folder=TRANSCRIPT_FOLDER):
+    # Recordings with the same name from different folders must not share a transcript file
+    text_output_path = os.path.join(text_folder, f"{title}_{media_hash[:12]}_text.txt")
+    tmp_path = text_output_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        file.write(text_data)
+    os.replace(tmp_path, text_output_path)
+    return text_output_path
+
+
+def ingest_text_file(file_path, file_name=None, dedup_policy=None):
+    """Headless version of the text upload flow; returns the ingestion state."""
+    return ingest_with_backoff(ingestion_state(file_path,
+                                               file_name or os.path.basename(file_path),
+                                               document_index,
+                                               "Text",
+                                               "Meta Doc Creator",
+                                               dedup_policy=dedup_policy))
+
+
+def ingest_video_file(video_path, audio_folder=None, text_folder=TRANSCRIPT_FOLDER,
+                      dedup_policy=None, reporter=None, media_hash=None, video_url=None):
+    """
+    Video ingestion flow shared by the app, the watcher and the batch CLI: transcribe, upload to VideoDB
+    (from `video_url` when given) and index the transcript. Returns the ingestion state.
+    """
+    reporter = reporter or streamlit_reporter
+    title = sanitize_filename(os.path.splitext(os.path.basename(video_path))[0])
+
+    video_hash = media_hash or hash_file(video_path)
+    skipped = skip_indexed_media(video_path, "Video", video_hash, dedup_policy, reporter)
+    if skipped:
+        return skipped
+
+    # A re-upload of the same video skips extraction and transcription
+    text_data = transcript_cache.get(video_hash)
+    if text_data is not None:
+        reporter.success('Reusing the transcript of a previous upload of this video.')
+    else:
+        # A scratch folder of its own: extracted audio named after the video would replace an uploaded
+        # recording of the same name in the uploads folder
+        with tempfile.TemporaryDirectory(dir=audio_folder, prefix="extract-") as work_dir:
+            output_audio_path = video_to_audio(video_path, work_dir, reporter=reporter)
+            reporter.success('Audio extracted successfully!')
+            text_data = audio_to_text(output_audio_path)
+        transcript_cache.put(video_hash, text_data)
+    text_output_path = write_transcript(title, text_data, video_hash, text_folder)
+    reporter.success(f'Text data saved to file: {text_output_path}')
+
+    if video_url:
+        video = video_db_conn.upload(url=video_url)
+    else:
+        video = video_db_conn.upload(file_path=video_path)
+    return process_and_index_files(text_output_path,
+                                   os.path.basename(video_path),
+                                   document_index,
+                                   "Video",
+                                   "Meta Transcript Creator",
+                                   vedio_id=video.id,
+                                   file_loc=video_path,
+                                   dedup_policy=dedup_policy,
+                                   reporter=reporter,
+                                   media_hash=video_hash)
+
+
+def ingest_audio_file(audio_path, video_folder=None, text_folder=TRANSCRIPT_FOLDER,
+                      dedup_policy=None, reporter=None, media_hash=None):
+    """
+    Audio ingestion flow shared by the app, the watcher and the batch CLI: render a still video for
+    VideoDB, transcribe and index the transcript. Returns the ingestion state.
+    """
+    reporter = reporter or streamlit_reporter
+    title = sanitize_filename(os.path.splitext(os.path.basename(audio_path))[0])
+
+    audio_hash = media_hash or hash_file(audio_path)
+    skipped = skip_indexed_media(audio_path, "Audio", audio_hash, dedup_policy, reporter)
+    if skipped:
+        return skipped
+
+    # Rendered outside the uploads folder, where it would replace an uploaded video of the same name
+    with tempfile.TemporaryDirectory(dir=video_folder, prefix="render-") as work_dir:
+        output_video_file = os.path.join(work_dir, f"{title}.mp4")
+        convert_mp3_to_mp4_with_image(
+            audio_file_path=audio_path,
+            image_file_path='assets/audio/audio_img.png',
+            output_video_path=output_video_file
+        )
+        video = video_db_conn.upload(file_path=output_video_file)
+    reporter.write(f"Uploaded {os.path.basename(audio_path)} to VideoDB")
+
+    text_data = audio_to_text(audio_path, is_audio=True, audio_hash=audio_hash)
+    text_output_path = write_transcript(title, text_data, audio_hash, text_folder)
+    reporter.success(f'Text data saved to file: {text_output_path}')
+
+    return process_and_index_files(text_output_path,
+                                   os.path.basename(audio_path),
+                                   document_index,
+                                   "Audio",
+                                   "Meta Transcript Creator",
+                                   vedio_id=video.id,
+                                   file_loc=audio_path,
+                                   dedup_policy=dedup_policy,
+                                   reporter=reporter,
+                                   media_hash=audio_hash)
 
 
 def main():
@@ -412,22 +810,101 @@ def main():
         bulk_files = st.file_uploader("Choose multiple text files for bulk upload", type=['txt', 'pdf', 'docx'],
                                       accept_multiple_files=True, key="bulk")
 
-        if bulk_files is not None:
+        background = st.checkbox("Process in background", key="bulk_background",
+                                 help="Queue the files for the ingestion workers (python ingestion_worker.py)")
+        parallel = st.checkbox("Process files in parallel", key="bulk_parallel")
+        workers = st.number_input("Parallel workers", min_value=1, max_value=32, value=BULK_INGEST_WORKERS,
+                                  key="bulk_workers", disabled=not parallel)
+        dedup_policy = st.selectbox("Already ingested documents", DEDUP_POLICIES,
+                                    index=DEDUP_POLICIES.index(DEDUP_POLICY), key="bulk_dedup_policy",
+                                    help="skip them, replace the indexed document or index a new version")
+
+        if bulk_files and background:
+            # Remember what was queued so a rerun of the script does not queue the same upload again
+            queued = st.session_state.setdefault("ingestion_jobs", {})
+            for file in bulk_files:
+                upload_key = f"{file.name}:{file.size}"
+                if upload_key not in queued:
+                    saved_file_path, title, content_hash = save_uploaded_file("IKMS Data Repo/Text", file)
+                    if saved_file_path:
+                        queued[upload_key] = job_queue.enqueue("index", ingestion_state(
+                            saved_file_path, file.name, document_index, "Text", "Meta Doc Creator",
+                            dedup_policy=dedup_policy, content_hash=content_hash))
+
+            jobs = job_queue.list_jobs(list(queued.values()))
+            st.dataframe(pd.DataFrame([{
+                "Job": job["id"],
+                "Document": job["state"]["file_name"],
+                "Status": job["status"],
+                "Stage": job["stage"],
+                "Attempts": job["attempts"],
+                "Skipped": job["state"].get("skipped", False),
+                "Error": job["error"],
+            } for job in jobs]))
+            st.button("Refresh status", key="refresh_ingestion_jobs")
+
+        elif bulk_files and parallel:
+            saved_files = []
+            for file in bulk_files:
+                saved_file_path, title, content_hash = save_uploaded_file("IKMS Data Repo/Text", file)
+                if saved_file_path:  # If the file was successfully saved
+                    saved_files.append((saved_file_path, file.name, content_hash))
+
+            total_files = len(saved_files)
+            progress_bar = st.progress(0)
+            wait_stats_before = dict(run_wait_stats)
+
+            with st.spinner(f'Processing and indexing {total_files} files with {workers} workers...'):
+                states = [ingestion_state(saved_file_path, file_name, document_index, "Text", "Meta Doc Creator",
+                                          dedup_policy=dedup_policy, content_hash=content_hash)
+                          for saved_file_path, file_name, content_hash in saved_files]
+
+                # Documents are written to Elasticsearch in batches through the _bulk API; leaving the block
+                # flushes the last batch and stops the flush timer even when a rerun interrupts the script
+                with bulk_indexer_for(document_index) as indexer:
+                    # Streamlit calls stay on the script thread, workers only run the pipeline stages
+                    with ThreadPoolExecutor(max_workers=workers) as executor:
+                        futures = {executor.submit(ingest_with_backoff, state, indexer=indexer): state
+                                   for state in states}
+                        for done, future in enumerate(as_completed(futures), start=1):
+                            file_name = futures[future]["file_name"]
+                            try:
+                                future.result()
+                                st.write(f'Processed {file_name}')
+                            except Exception as e:
+                                st.error(f"Error processing {file_name}: {str(e)}")
+                            progress_bar.progress(int(done / total_files * 100))
+
+                for state in states:
+                    if state.get("skipped"):
+                        st.info(f'Skipped {state["file_name"]}, the same content is already indexed')
+                    elif state.get("document_id"):
+                        st.success(f'Finished processing {state["file_name"]}')
+                    elif state.get("index_error"):
+                        st.error(f'Error indexing {state["file_name"]}: {state["index_error"]}')
+
+            st.success("Finished processing all files.")
+            st.caption(run_wait_summary(since=wait_stats_before))
+
+        elif bulk_files is not None:
 
             total_files = len(bulk_files)
             progress_bar = st.progress(0)
+            wait_stats_before = dict(run_wait_stats)
 
             for index, file in enumerate(bulk_files):
                 with st.spinner(f'Processing and indexing {file.name}...'):
-                    saved_file_path, title = save_uploaded_file("IKMS Data Repo/Text", file)
+                    saved_file_path, title, content_hash = save_uploaded_file("IKMS Data Repo/Text", file)
                     if saved_file_path:  # If the file was successfully saved
-                        process_and_index_files(saved_file_path, file.name, document_index, "Text", "Meta Doc Creator")
+                        process_and_index_files(saved_file_path, file.name, document_index, "Text", "Meta Doc Creator",
+                                                dedup_policy=dedup_policy, content_hash=content_hash)
                 st.success(f'Finished processing {file.name}')
 
                 progress_percentage = int(((index + 1) / total_files) * 100)
                 progress_bar.progress(progress_percentage)
 
             st.success("Finished processing all files.")
+            st.caption(run_wait_summary(since=wait_stats_before))
 
     # Expander for video uploads
     with st.expander("Upload Videos"):
@@ -437,36 +914,15 @@ def main():
             st.video(video_file)
             video_path = "IKMS Data Repo/Video"
 
-            saved_file_path, title = save_uploaded_file(video_path, video_file)
+            saved_file_path, title, video_hash = save_uploaded_file(video_path, video_file)
 
             if saved_file_path:
 
                 st.success(f"Successfully saved {video_file.name} to {video_path}/")
 
-                with st.spinner('Extracting audio from video...'):
+                with st.spinner(f'Transcribing and indexing {video_file.name}...'):
                     try:
-                        output_audio_path = video_to_audio(saved_file_path, "IKMS Data Repo/Audio")
-                        st.success('Audio extracted successfully!')
-                    except Exception as e:
-                        st.error(f"Error extracting audio: {e}")
-                        raise e  # Re-raise exception if needed
-
-                with st.spinner('Transcribing audio to text...'):
-                    try:
-                        text_data = audio_to_text(output_audio_path)
-                        text_output_path = "IKMS Data Repo/Text/" + title + "_text.txt"
-                        with open(text_output_path, "w") as file:
-                            file.write(text_data)
-                        st.success(f'Text data saved to file: {text_output_path}')
-                        video = video_db_conn.upload(file_path=saved_file_path)
-                        video_id = video.id
-                        process_and_index_files(text_output_path,
-                                                file.name,
-                                                document_index,
-                                                "Video",
-                                                "Meta Transcript Creator",
-                                                vedio_id=video_id,
-                                                file_loc=saved_file_path)
+                        ingest_video_file(saved_file_path, media_hash=video_hash, reporter=streamlit_reporter)
                     except Exception as e:
                         st.error(f"Error during transcription: {e}")
             else:
@@ -488,31 +944,9 @@ def main():
                     st.error(f"Error downloading video: {e}")
                     raise e  # Re-raise exception if you need to stop the process here
 
-            with st.spinner('Extracting audio from video...'):
-                try:
-                    output_audio_path = video_to_audio(video_metadata["FilePath"], "IKMS Data Repo/Audio")
-                    st.success('Audio extracted successfully!')
-                except Exception as e:
-                    st.error(f"Error extracting audio: {e}")
-                    raise e  # Re-raise exception if needed
-
-            with st.spinner('Transcribing audio to text...'):
+            with st.spinner('Transcribing and indexing the video...'):
                 try:
-                    text_data = audio_to_text(output_audio_path)
-                    text_output_path = "IKMS Data Repo/Text/" + title + "_text.txt"
-                    with open(text_output_path, "w") as file:
-                        file.write(text_data)
-                    st.success(f'Text data saved to file: {text_output_path}')
-                    video = video_db_conn.upload(url=video_url)
-                    video_id = video.id
-                    process_and_index_files(text_output_path,
-                                            file.name,
-                                            document_index,
-                                            "Video",
-                                            "Meta Transcript Creator",
-                                            vedio_id=video_id,
-                                            file_loc=saved_file_path
-                                            )
+                    ingest_video_file(video_metadata["FilePath"], video_url=video_url, reporter=streamlit_reporter)
                 except Exception as e:
                     st.error(f"Error during transcription: {e}")
 
@@ -525,45 +959,15 @@ def main():
         if audio_files is not None:
             for audio_file in audio_files:
                 with st.spinner('Uploading audio...'):
-                    saved_file_path, title = save_uploaded_file(audio_path, audio_file)
+                    saved_file_path, title, audio_hash = save_uploaded_file(audio_path, audio_file)
                     st.success('Audio uploaded successfully.')
 
-                # Generate video file path
-                output_directory = "IKMS Data Repo/Video"
-                output_video_file = os.path.join(output_directory, f"{title}.mp4")
-
-                # Load the audio and image clips
-                with st.spinner('Processing audio for video creation...'):
-                    convert_mp3_to_mp4_with_image(
-                        audio_file_path=saved_file_path,
-                        image_file_path='assets/audio/audio_img.png',
-                        output_video_path=output_video_file
-                    )
-                    st.success(f'Video file created: {output_video_file}')
-
-                    video = video_db_conn.upload(file_path=output_video_file)
-                    video_id = video.id
-
-                    os.remove(output_video_file)
-
-                # Transcribe audio to text
-                with st.spinner('Transcribing audio to text...'):
-                    text_data = audio_to_text(saved_file_path, is_audio=True)
-                    text_output_path = "IKMS Data Repo/Text/" + title + "_text.txt"
-                    with open(text_output_path, "w") as file:
-                        file.write(text_data)
-                    st.success(f'Text data saved to file: {text_output_path}')
-
-                process_and_index_files(text_output_path,
-                                        file.name,
-                                        document_index,
-                                        "Audio",
-                                        "Meta Transcript Creator",
-                                        vedio_id=video_id,
-                                        file_loc=saved_file_path)
-
-                # Final success message for the entire process
-                st.success(f"Processing complete. Audio, Video and text files saved.")
+                with st.spinner(f'Transcribing and indexing {audio_file.name}...'):
+                    try:
+                        ingest_audio_file(saved_file_path, media_hash=audio_hash, reporter=streamlit_reporter)
+                        st.success(f"Processing complete. Audio, Video and text files saved.")
+                    except Exception as e:
+                        st.error(f"Error processing {audio_file.name}: {e}")
 
 
 if __name__ == "__main__":
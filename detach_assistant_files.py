@@ -0,0 +1,48 @@
+import argparse
+import os
+
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch
+from openai import OpenAI
+
+load_dotenv()
+
+ASSISTANT_INDEX = "ikms-assistants"
+
+
+def registry_assistant_ids(es, index_name=ASSISTANT_INDEX):
+    query = {"query": {"match_all": {}}}
+    response = es.search(index=index_name, body=query, size=1000)
+    return [hit["_source"]["assistant_id"] for hit in response["hits"]["hits"]]
+
+
+def detach_files(client, assistant_ids, dry_run=False):
+    """
+    Remove the files attached to each assistant. Documents are attached to the thread messages now,
+    but retrieval still searches files left on the assistant by earlier versions of the pipeline.
+    """
+    for assistant_id in assistant_ids:
+        assistant = client.beta.assistants.retrieve(assistant_id)
+        if not assistant.file_ids:
+            continue
+        print(f"{assistant.name} ({assistant_id}): detaching {len(assistant.file_ids)} files")
+        if not dry_run:
+            client.beta.assistants.update(assistant_id, file_ids=[])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detach files left on the registered and chat assistants (run once).")
+    parser.add_argument("--chat-assistant", default=os.getenv("ASSISTANT_ID"),
+                        help="id of the chat app's assistant, which is not in the registry index")
+    parser.add_argument("--dry-run", action="store_true", help="only list the assistants that still have files")
+    args = parser.parse_args()
+
+    es = Elasticsearch(os.getenv('ES_END_POINT'), api_key=os.getenv('ES_API_KEY'))
+    assistant_ids = registry_assistant_ids(es)
+    if args.chat_assistant:
+        assistant_ids.append(args.chat_assistant)
+    detach_files(OpenAI(), assistant_ids, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+
+from elasticsearch import helpers
+
+BULK_INDEX_MAX_DOCS = int(os.getenv("BULK_INDEX_MAX_DOCS", 500))
+BULK_INDEX_MAX_BYTES = int(os.getenv("BULK_INDEX_MAX_BYTES", 5 * 1024 * 1024))
+BULK_INDEX_MAX_SECONDS = float(os.getenv("BULK_INDEX_MAX_SECONDS", 5))
+
+
+class BulkIndexer:
+    """
+    Buffers documents and writes them with the Elasticsearch _bulk API.
+
+    The buffer is flushed when it holds `max_docs` documents or `max_bytes` of JSON, when its oldest
+    document has waited `max_seconds`, and on close. `on_result(context, ok, item)` is called once per
+    document with the context passed to `add` and the per-item response of the bulk request.
+    """
+
+    def __init__(self, es, index, max_docs=BULK_INDEX_MAX_DOCS, max_bytes=BULK_INDEX_MAX_BYTES,
+                 max_seconds=BULK_INDEX_MAX_SECONDS, on_result=None, on_flush=None):
+        self.es = es
+        self.index = index
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.on_result = on_result
+        self.on_flush = on_flush
+        self._buffer = []  # (action, context)
+        self._buffer_bytes = 0
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._timer.start()
+
+    def add(self, document, doc_id=None, context=None):
+        action = {"_index": self.index, "_source": document}
+        if doc_id is not None:
+            action["_id"] = doc_id
+        size = len(json.dumps(document, default=str))
+
+        with self._lock:
+            self._buffer.append((action, context))
+            self._buffer_bytes += size
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._buffer) >= self.max_docs or self._buffer_bytes >= self.max_bytes
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far; returns a list of (context, ok, item)."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._buffer
+                self._buffer = []
+                self._buffer_bytes = 0
+                self._oldest = None
+            if not batch:
+                return []
+
+            results = []
+            actions = (action for action, _ in batch)
+            try:
+                responses = helpers.streaming_bulk(self.es, actions, chunk_size=len(batch),
+                                                   max_chunk_bytes=self.max_bytes + 1024 * 1024,
+                                                   raise_on_error=False, raise_on_exception=False)
+                for (_, context), (ok, item) in zip(batch, responses):
+                    results.append((context, ok, item))
+            except Exception as e:
+                # The request itself failed: report every document that did not get a response
+                for _, context in batch[len(results):]:
+                    results.append((context, False, {"error": str(e)}))
+
+            if self.on_flush:
+                self.on_flush(results)
+            if self.on_result:
+                for context, ok, item in results:
+                    self.on_result(context, ok, item)
+            return results
+
+    def _flush_periodically(self):
+        while not self._closed.wait(min(self.max_seconds, 1.0)):
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.max_seconds
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Bulk indexing flush failed: {e}")
+
+    def close(self):
+        self._closed.set()
+        self._timer.join()
+        return self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
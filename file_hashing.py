@@ -0,0 +1,12 @@
+import hashlib
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path, algorithm="sha256", chunk_size=HASH_CHUNK_SIZE):
+    """Return the hex digest of a file's content, read in fixed-size chunks."""
+    digest = hashlib.new(algorithm)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+
+from file_hashing import hash_file
+
+FILE_ID_CACHE_PATH = os.getenv("FILE_ID_CACHE_PATH", ".cache/openai_file_ids.json")
+FILE_ID_CACHE_TTL = int(os.getenv("FILE_ID_CACHE_TTL", 7 * 24 * 60 * 60))  # seconds
+FILE_ID_CACHE_MAX_ENTRIES = int(os.getenv("FILE_ID_CACHE_MAX_ENTRIES", 2000))
+
+
+class FileIdCache:
+    """
+    Persistent map from local file content to an already uploaded OpenAI file ID.
+
+    Entries are keyed by the SHA-256 of the file content, so the same document reached through
+    different paths is uploaded once. A (mtime, size) fast path avoids re-hashing unchanged files,
+    and entries are evicted least recently used first once older than the TTL or over capacity.
+    """
+
+    def __init__(self, path=FILE_ID_CACHE_PATH, ttl=FILE_ID_CACHE_TTL, max_entries=FILE_ID_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}  # content hash -> {"file_id", "created_at", "last_used"}
+        self._signatures = {}  # local path -> {"mtime", "size", "hash"}
+        self._load()
+
+    def content_hash(self, file_path):
+        stat = os.stat(file_path)
+        with self._lock:
+            known = self._signatures.get(file_path)
+        if known and known["mtime"] == stat.st_mtime and known["size"] == stat.st_size:
+            return known["hash"]
+
+        content_hash = hash_file(file_path)
+        with self._lock:
+            self._signatures[file_path] = {"mtime": stat.st_mtime, "size": stat.st_size, "hash": content_hash}
+        return content_hash
+
+    def get(self, file_path):
+        """Return the cached file ID for the file at `file_path`, or None on a miss."""
+        content_hash = self.content_hash(file_path)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(content_hash)
+            if entry is None:
+                return None
+            if now - entry["created_at"] > self.ttl:
+                del self._entries[content_hash]
+                self._save()
+                return None
+            entry["last_used"] = now
+            return entry["file_id"]
+
+    def put(self, file_path, file_id):
+        content_hash = self.content_hash(file_path)
+        now = time.time()
+        with self._lock:
+            self._entries[content_hash] = {"file_id": file_id, "created_at": now, "last_used": now}
+            self._evict(now)
+            self._save()
+
+    def discard(self, file_id):
+        """Forget a file ID, e.g. after OpenAI reports it no longer exists."""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry["file_id"] == file_id]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._save()
+
+    def _evict(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            by_last_use = sorted(self._entries, key=lambda key: self._entries[key]["last_used"])
+            for key in by_last_use[:overflow]:
+                del self._entries[key]
+
+        live_hashes = set(self._entries)
+        self._signatures = {path: sig for path, sig in self._signatures.items() if sig["hash"] in live_hashes}
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self._entries = data.get("entries", {})
+        self._signatures = data.get("signatures", {})
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write to a temp file and swap it in so a crash never leaves a truncated cache behind
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": self._entries, "signatures": self._signatures}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+
+from file_hashing import hash_file
+from progress_reporter import ProgressReporter
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional, without it the folders are polled
+    FileSystemEventHandler = object
+    Observer = None
+
+# A drop folder of its own: the app writes uploads, transcripts and intermediate files into "IKMS Data Repo"
+WATCH_BASE_DIR = os.getenv("WATCH_BASE_DIR", "IKMS Drop")
+APP_DATA_DIR = "IKMS Data Repo"
+WATCH_MANIFEST_PATH = os.getenv("WATCH_MANIFEST_PATH", ".cache/watch_manifest.json")
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", 60))  # seconds between full scans
+WATCH_SETTLE_SECONDS = float(os.getenv("WATCH_SETTLE_SECONDS", 10))  # files modified more recently are still being copied
+WATCH_MAX_ATTEMPTS = int(os.getenv("WATCH_MAX_ATTEMPTS", 3))
+
+# Sub folders of the drop folder and the files each ingestion path accepts
+folder_extensions = {
+    "Text": {".txt", ".pdf", ".docx"},
+    "Audio": {".mp3", ".wav"},
+    "Video": {".mp4", ".mov", ".avi"},
+}
+
+
+class Manifest:
+    """
+    Persistent record of every file seen in the watched folders: mtime, size, content hash and
+    ingestion status. Unchanged files are recognised from their mtime and size without hashing.
+    """
+
+    def __init__(self, path=WATCH_MANIFEST_PATH):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def unchanged(self, path, stat):
+        entry = self.entries.get(path)
+        return entry is not None and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size
+
+    def needs_ingestion(self, path, stat):
+        entry = self.entries.get(path)
+        if entry is None:
+            return True
+        if self.unchanged(path, stat):
+            return entry["status"] == "failed" and entry.get("attempts", 0) < WATCH_MAX_ATTEMPTS
+
+        # Touched or copied again: only content changes count
+        content_hash = hash_file(path)
+        if content_hash == entry["hash"] and entry["status"] == "done":
+            entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+            return False
+        entry["attempts"] = 0
+        return True
+
+    def record(self, path, status, **fields):
+        try:
+            stat = os.stat(path)
+            content_hash = hash_file(path)
+        except FileNotFoundError:
+            # Moved or deleted while it was being ingested, it is treated as new should it come back
+            print(f"{path} disappeared, dropping it from the manifest")
+            self.entries.pop(path, None)
+            return
+        entry = self.entries.setdefault(path, {"attempts": 0})
+        entry.update(mtime=stat.st_mtime, size=stat.st_size, hash=content_hash, status=status,
+                     updated_at=time.time(), **fields)
+        if status == "failed":
+            entry["attempts"] = entry.get("attempts", 0) + 1
+
+
+def scan(base_dir, manifest, settle_seconds=WATCH_SETTLE_SECONDS):
+    """Return ([(folder, path)] of new or changed files, whether some files were skipped as still being written)."""
+    pending = []
+    unsettled = False
+    now = time.time()
+    for folder, extensions in folder_extensions.items():
+        try:
+            entries = sorted(os.scandir(os.path.join(base_dir, folder)), key=lambda e: e.name)
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in extensions:
+                continue
+            try:
+                stat = entry.stat()
+                if not manifest.unchanged(entry.path, stat) and now - stat.st_mtime < settle_seconds:
+                    unsettled = True
+                    continue
+                if manifest.needs_ingestion(entry.path, stat):
+                    pending.append((folder, entry.path))
+            except FileNotFoundError:
+                continue  # deleted since the folder was listed
+    return pending, unsettled
+
+
+def ingest(folder, path, pipeline, work_dir):
+    # Intermediate audio and video go to a scratch folder so they never show up in a watched folder
+    if folder == "Text":
+        return pipeline.ingest_text_file(path)
+    if folder == "Audio":
+        return pipeline.ingest_audio_file(path, video_folder=work_dir, reporter=ProgressReporter())
+    return pipeline.ingest_video_file(path, audio_folder=work_dir, reporter=ProgressReporter())
+
+
+def setup_drop_folder(base_dir):
+    if os.path.realpath(base_dir) == os.path.realpath(APP_DATA_DIR):
+        # The app's own uploads and transcripts would be ingested a second time
+        raise SystemExit(f"{base_dir} is written by the ingestion app, watch a separate drop folder")
+    for folder in folder_extensions:
+        os.makedirs(os.path.join(base_dir, folder), exist_ok=True)
+
+
+def run_once(base_dir, manifest, settle_seconds=WATCH_SETTLE_SECONDS):
+    pending, unsettled = scan(base_dir, manifest, settle_seconds)
+    if pending:
+        import data_ingestion_pipeline as pipeline
+
+        # Transcripts are written to the app's folders, which the app may never have created on this server
+        pipeline.setup_directories()
+        with tempfile.TemporaryDirectory() as work_dir:
+            for folder, path in pending:
+                print(f"Ingesting {path}")
+                try:
+                    state = ingest(folder, path, pipeline, work_dir)
+                    if state.get("error"):
+                        raise RuntimeError(state["error"])
+                    manifest.record(path, "done", document_id=state.get("document_id"),
+                                    skipped=state.get("skipped", False), error=None)
+                except Exception as e:
+                    traceback.print_exc()
+                    manifest.record(path, "failed", error=f"{type(e).__name__}: {e}")
+                manifest.save()
+    manifest.save()
+    return len(pending), unsettled
+
+
+class _WakeOnChange(FileSystemEventHandler):
+    def __init__(self, wake):
+        self.wake = wake
+
+    def on_any_event(self, event):
+        if not event.is_directory:
+            self.wake.set()
+
+
+def watch(base_dir=WATCH_BASE_DIR, manifest_path=WATCH_MANIFEST_PATH, interval=WATCH_INTERVAL,
+          settle_seconds=WATCH_SETTLE_SECONDS):
+    """Ingest new and changed files forever, woken by inotify events when watchdog is installed."""
+    setup_drop_folder(base_dir)
+    manifest = Manifest(manifest_path)
+    wake = threading.Event()
+    observer = None
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(_WakeOnChange(wake), base_dir, recursive=True)
+        observer.start()
+    else:
+        print(f"watchdog is not installed, polling {base_dir} every {interval} seconds")
+
+    try:
+        while True:
+            wake.clear()
+            ingested, unsettled = run_once(base_dir, manifest, settle_seconds)
+            if ingested:
+                print(f"Ingested {ingested} new or changed files")
+            # Come back as soon as files that are still being copied have settled
+            wake.wait(settle_seconds if unsettled else interval)
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest new and changed files dropped into a watched folder.")
+    parser.add_argument("--base-dir", default=WATCH_BASE_DIR, help="drop folder with Text, Audio and Video sub folders")
+    parser.add_argument("--manifest", default=WATCH_MANIFEST_PATH, help="path of the manifest file")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="seconds between full scans")
+    parser.add_argument("--settle", type=float, default=WATCH_SETTLE_SECONDS,
+                        help="ignore files modified less than this many seconds ago")
+    parser.add_argument("--once", action="store_true", help="scan a single time and exit")
+    args = parser.parse_args()
+
+    if args.once:
+        setup_drop_folder(args.base_dir)
+        ingested, _ = run_once(args.base_dir, Manifest(args.manifest), args.settle)
+        print(f"Ingested {ingested} new or changed files")
+    else:
+        watch(args.base_dir, args.manifest, args.interval, args.settle)
+
+
+if __name__ == "__main__":
+    main()
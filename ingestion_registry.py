@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+INGESTION_REGISTRY_DB = os.getenv("INGESTION_REGISTRY_DB", ".cache/ingested_documents.sqlite3")
+
+
+class ContentHashRegistry:
+    """
+    Local lookup table from document content hash to the Elasticsearch document it was indexed as.
+
+    It mirrors the 'Content Hash' field of the document index so duplicate checks usually need no
+    search; Elasticsearch stays the source of truth when the table has no entry.
+    """
+
+    def __init__(self, path=INGESTION_REGISTRY_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    content_hash TEXT PRIMARY KEY,
+                    document_id TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    file_path TEXT,
+                    indexed_at REAL NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def lookup(self, content_hash):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM documents WHERE content_hash = ?", (content_hash,)).fetchone()
+            return dict(row) if row else None
+
+    def record(self, content_hash, document_id, version=1, file_path=None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (content_hash, document_id, version, file_path, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (content_hash, document_id, version, file_path, time.time()),
+            )
+
+    def forget(self, content_hash):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM documents WHERE content_hash = ?", (content_hash,))
@@ -0,0 +1,57 @@
+import argparse
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+
+from job_queue import INGESTION_JOB_DB, JobQueue
+
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", os.cpu_count() or 1))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", 2))
+
+
+def run_index_job(job, queue):
+    """Run the stages of process_and_index_files for one document, checkpointing after each stage."""
+    import data_ingestion_pipeline as pipeline
+
+    return pipeline.run_ingestion_stages(job["state"],
+                                         checkpoint=lambda stage, state: queue.checkpoint(job["id"], stage, state))
+
+
+job_runners = {
+    "index": run_index_job,
+}
+
+
+def work(queue_path, poll_seconds=WORKER_POLL_SECONDS):
+    queue = JobQueue(queue_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(poll_seconds)
+            continue
+        try:
+            state = job_runners[job["kind"]](job, queue)
+            queue.complete(job["id"], state)
+        except Exception as e:
+            traceback.print_exc()
+            queue.fail(job["id"], f"{type(e).__name__}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background ingestion workers.")
+    parser.add_argument("--workers", type=int, default=INGESTION_WORKERS, help="number of worker processes")
+    parser.add_argument("--queue", default=INGESTION_JOB_DB, help="path of the SQLite job queue")
+    args = parser.parse_args()
+
+    processes = [multiprocessing.Process(target=work, args=(args.queue,), daemon=True) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+INGESTION_JOB_DB = os.getenv("INGESTION_JOB_DB", ".cache/ingestion_jobs.sqlite3")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 15 * 60))  # a running job not updated for this long is reclaimed
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of ingestion jobs shared by the Streamlit UI and the worker processes.
+
+    A job carries a JSON `state` that workers checkpoint after every completed stage, so a job
+    that failed or whose worker died resumes from its last finished stage instead of from scratch.
+    """
+
+    def __init__(self, path=INGESTION_JOB_DB, max_attempts=JOB_MAX_ATTEMPTS, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    state TEXT NOT NULL,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["state"] = json.loads(job["state"])
+        return job
+
+    def enqueue(self, kind, state):
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, status, state, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+                (kind, json.dumps(state), now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker):
+        """Atomically take the oldest queued (or abandoned running) job, or return None."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A job whose worker kept dying while holding it has used up its attempts
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', error = COALESCE(error, 'worker lease expired'), updated_at = ?
+                    WHERE status = 'running' AND updated_at < ? AND attempts >= ?
+                    """,
+                    (now, now - self.lease_seconds, self.max_attempts),
+                )
+                row = conn.execute(
+                    """
+                    SELECT * FROM jobs
+                    WHERE status = 'queued' OR (status = 'running' AND updated_at < ? AND attempts < ?)
+                    ORDER BY id LIMIT 1
+                    """,
+                    (now - self.lease_seconds, self.max_attempts),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, updated_at = ? "
+                        "WHERE id = ?",
+                        (worker, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._to_job(row)
+        job["status"] = "running"
+        job["attempts"] += 1
+        return job
+
+    def checkpoint(self, job_id, stage, state):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, state = ?, updated_at = ? WHERE id = ?",
+                (stage, json.dumps(state), time.time(), job_id),
+            )
+
+    def complete(self, job_id, state):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', stage = 'done', state = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (json.dumps(state), time.time(), job_id),
+            )
+
+    def fail(self, job_id, error):
+        """Record an error; the job is queued again until it has used up its attempts."""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, error = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (self.max_attempts, error, time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            return self._to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list_jobs(self, job_ids):
+        if not job_ids:
+            return []
+        placeholders = ",".join("?" for _ in job_ids)
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM jobs WHERE id IN ({placeholders}) ORDER BY id", list(job_ids))
+            return [self._to_job(row) for row in rows]
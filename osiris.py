@@ -1,11 +1,13 @@
 import json
 import os
 import ast
+import asyncio
+from contextlib import contextmanager
 from chainlit.types import ThreadDict
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any, List
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, BadRequestError, NotFoundError
 from openai.types.beta import Thread
 from openai.types.beta.threads import (
     MessageContentImageFile,
@@ -18,15 +20,31 @@ import os
 import time
 import json
 import re
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch
 from chainlit.element import Element
 import chainlit as cl
+from chainlit.logger import logger
+from file_id_cache import FileIdCache
+from vocabulary_cache import AsyncVocabularyCache
+from vocabulary_index import VocabularyIndex, resolve_shortlist
+from query_cache import QueryCache
 
 api_key = os.environ.get("OPENAI_API_KEY")
 assistant_id = os.environ.get("ASSISTANT_ID")
 assistant_index = "ikms-assistants"
 document_index = "meta-summary-registry"
 
+RUN_POLL_INITIAL = float(os.getenv("CHAT_RUN_POLL_INITIAL", 0.25))  # seconds
+RUN_POLL_MAX = float(os.getenv("CHAT_RUN_POLL_MAX", 2))  # seconds
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 8))
+# Assistants v1 accepts at most 10 files per message
+FILTER_TOP_K = int(os.getenv("FILTER_TOP_K", 10))
+KEYWORD_MATCH_WEIGHT = float(os.getenv("KEYWORD_MATCH_WEIGHT", 1.0))
+DOMAIN_MATCH_BOOST = float(os.getenv("DOMAIN_MATCH_BOOST", 2.0))
+RECENCY_BOOST = float(os.getenv("RECENCY_BOOST", 1.0))
+RECENCY_PIVOT = os.getenv("RECENCY_PIVOT", "90d")
+CHAT_TIMINGS_LOG_LEVEL = os.getenv("CHAT_TIMINGS_LOG_LEVEL", "INFO")  # WARNING turns the turn timings off
+
 # Instrument the OpenAI client
 client = AsyncOpenAI(api_key=api_key)
 cl.instrument_openai()
@@ -34,11 +52,31 @@ cl.instrument_openai()
 # List of allowed mime types
 allowed_mime = ["text/csv", "application/pdf"]
 
-es = Elasticsearch(
+# One async client per worker, its connection pool is shared by every chat session
+es = AsyncElasticsearch(
     os.getenv('ES_END_POINT'),  # Elasticsearch endpoint
     api_key=os.getenv('ES_API_KEY'),  # API key ID and secret
+    request_timeout=float(os.getenv('ES_REQUEST_TIMEOUT', 10)),
+    max_retries=int(os.getenv('ES_MAX_RETRIES', 2)),
+    retry_on_timeout=True,
+    connections_per_node=int(os.getenv('ES_CONNECTIONS_PER_NODE', 25)),
 )
 
+# Maps document content to file IDs already uploaded to OpenAI so repeated documents are not re-sent
+file_id_cache = FileIdCache()
+upload_semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+# Unique keywords and domains of the document registry, refreshed in the background
+vocabulary_cache = AsyncVocabularyCache(es, document_index)
+vocabulary_index = VocabularyIndex(vocabulary_cache)
+
+# Routing and retrieval results of recent questions
+query_cache = QueryCache()
+
+# Per-stage durations of every chat turn, written through Chainlit's log handler
+timings_logger = logger.getChild("timings")
+timings_logger.setLevel(CHAT_TIMINGS_LOG_LEVEL)
+
 
 @cl.author_rename
 def rename(orig_author: str):
@@ -65,18 +103,57 @@ async def upload_files(files: List[Element]):
     return file_ids
 
 
-# Upload files to the assistant
-@cl.step(name="RAG Builder", root=True)
+async def upload_file_from_path(file_path):
+    # Hashing touches the disk, keep it off the event loop
+    file_id = await asyncio.to_thread(file_id_cache.get, file_path)
+    if file_id is None:
+        async with upload_semaphore:
+            uploaded_file = await client.files.create(
+                file=Path(file_path), purpose="assistants"
+            )
+        file_id = uploaded_file.id
+        await asyncio.to_thread(file_id_cache.put, file_path, file_id)
+    return file_id
+
+
+# Upload files to the assistant, concurrently but at most UPLOAD_CONCURRENCY at a time
 async def upload_files_from_path(file_paths):
-    file_ids = []
-    for file_path in file_paths:
-        uploaded_file = await client.files.create(
-            file=Path(file_path), purpose="assistants"
-        )
-        file_ids.append(uploaded_file.id)
+    return list(await asyncio.gather(*(upload_file_from_path(file_path) for file_path in file_paths)))
+
+
+# Collect the file ids of the filtered documents, uploading only those indexed without one
+@cl.step(name="RAG Builder", root=True)
+async def resolve_file_ids(documents: List[Dict]):
+    file_ids = [document["File Id"] for document in documents if document.get("File Id")]
+    missing_paths = [document["Document path"] for document in documents if not document.get("File Id")]
+    if missing_paths:
+        file_ids.extend(await upload_files_from_path(missing_paths))
     return file_ids
 
 
+async def find_missing_file_ids(file_ids):
+    """File ids OpenAI no longer knows, e.g. because the file was deleted on their side."""
+    async def missing(file_id):
+        try:
+            await client.files.retrieve(file_id)
+            return False
+        except NotFoundError:
+            return True
+
+    flags = await asyncio.gather(*(missing(file_id) for file_id in file_ids))
+    return {file_id for file_id, gone in zip(file_ids, flags) if gone}
+
+
+async def replace_stale_file_ids(documents: List[Dict], stale_ids):
+    """Forget deleted file ids and upload the affected documents again, updating the ids stored in the index."""
+    for file_id in stale_ids:
+        await asyncio.to_thread(file_id_cache.discard, file_id)
+    for document in documents:
+        if document.get("File Id") in stale_ids:
+            document["File Id"] = await upload_file_from_path(document["Document path"])
+            await es.update(index=document_index, id=document["Document Id"], doc={"File Id": document["File Id"]})
+
+
 async def process_files(files: List[Element]):
     # Upload files if any and get file_ids
     file_ids = []
@@ -169,6 +246,24 @@ async def process_tool_call(
         await cl_step.send()
 
 
+class TurnTimer:
+    """Wall-clock duration of each stage of a chat turn."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    def __str__(self):
+        return ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.timings.items())
+
+
 class DictToObject:
     def __init__(self, dictionary):
         for key, value in dictionary.items():
@@ -193,54 +288,18 @@ async def start_chat():
 
 @cl.step(name="Document Search Query Builder", root=True)
 async def search_documents(user_query: str):
-    keywords_query = {
-        "size": 0,
-        "aggs": {
-            "nested_metadata": {
-                "nested": {
-                    "path": "Metadata"
-                },
-                "aggs": {
-                    "unique_doc_keywords": {
-                        "terms": {
-                            "field": "Metadata.DOC_Keywords",
-                            "size": 10000
-                        }
-                    }
-                }
-            }
-        }
-    }
-
-    domains_query = {
-        "size": 0,
-        "aggs": {
-            "nested_metadata": {
-                "nested": {
-                    "path": "Metadata"
-                },
-                "aggs": {
-                    "unique_domains": {
-                        "terms": {
-                            "field": "Metadata.Domain.keyword",
-                            "size": 10000
-                        }
-                    }
-                }
-            }
-        }
-    }
+    await vocabulary_cache.get()
 
-    keywords_response = es.search(index=document_index, body=keywords_query)
-    # Extract the list of unique document keywords from the response
-    unique_doc_keywords = [bucket['key'] for bucket in
-                           keywords_response['aggregations']['nested_metadata']['unique_doc_keywords']['buckets']]
+    # Shortlist the vocabulary locally so the prompt stays bounded as the registry grows
+    shortlist = await asyncio.to_thread(vocabulary_index.shortlist, user_query)
 
-    domains_response = es.search(index=document_index, body=domains_query)
+    # Skip the LLM when the query names existing keywords and domains outright
+    resolved = resolve_shortlist(shortlist)
+    if resolved is not None:
+        return resolved
 
-    # Extract the list of unique domains from the response
-    unique_domains = [bucket['key'] for bucket in
-                      domains_response['aggregations']['nested_metadata']['unique_domains']['buckets']]
+    unique_doc_keywords = [keyword for keyword, _ in shortlist["Keywords"]]
+    unique_domains = [domain for domain, _ in shortlist["Domains"]]
 
     prompt = """
     I am the retriever, an expert in selecting Keywords and Domains variables to search an elastic db from KEYWORDS and DOMAIN set provided in the below section. I will receive the USER_QUERY and then analyze the request to understand the domain and the keywords.
@@ -292,192 +351,260 @@ async def search_documents(user_query: str):
     return data_dict
 
 
-@cl.step(name="Document filter Agent", root=True)
-async def filter_documents(data_dict: Dict):
+def build_ranked_query(data_dict: Dict, size: int, search_after: List = None):
+    # Every matching keyword adds the same amount, so documents are ranked by keyword overlap
+    keyword_clauses = [{
+        "nested": {
+            "path": "Metadata",
+            "score_mode": "max",
+            "query": {
+                "constant_score": {
+                    "filter": {"term": {"Metadata.DOC_Keywords": keyword}},
+                    "boost": KEYWORD_MATCH_WEIGHT
+                }
+            }
+        }
+    } for keyword in data_dict['Keywords']]
+
+    domain_clause = {
+        "nested": {
+            "path": "Metadata",
+            "score_mode": "max",
+            "query": {
+                "constant_score": {
+                    "filter": {"terms": {"Metadata.Domain.keyword": data_dict['Domains']}},
+                    "boost": DOMAIN_MATCH_BOOST
+                }
+            }
+        }
+    }
 
-    should_clauses = [{"match": {"Metadata.Domain": domain}} for domain in data_dict['Domains']]
+    # Newer documents score higher, documents indexed without a timestamp get no recency bonus
+    recency_clause = {
+        "distance_feature": {
+            "field": "Indexed At",
+            "origin": "now",
+            "pivot": RECENCY_PIVOT,
+            "boost": RECENCY_BOOST
+        }
+    }
 
     query_map = {
+        "size": size,
+        "_source": ["Document Name", "Document Source", "File Id"],
         "query": {
             "bool": {
-                "must": [
-                    {
-                        "nested": {
-                            "path": "Metadata",
-                            "query": {
-                                "bool": {
-                                    "should": should_clauses
-                                }
-                            }
-                        }
-                    },
-                    {
-                        "nested": {
-                            "path": "Metadata",
-                            "query": {
-                                "bool": {
-                                    "must": [
-                                        {
-                                            "terms": {
-                                                "Metadata.DOC_Keywords": data_dict['Keywords']
-                                            }
-                                        }
-                                    ]
-                                }
-                            }
-                        }
-                    }
-                ]
+                "must": [{"bool": {"should": keyword_clauses, "minimum_should_match": 1}}],
+                "should": [domain_clause, recency_clause]
             }
-        }
+        },
+        # The document path breaks score ties so search_after pages are stable
+        "sort": [{"_score": "desc"}, {"Document Source.keyword": {"order": "asc", "missing": "_last"}}]
     }
+    if search_after:
+        query_map["search_after"] = search_after
+    return query_map
+
+
+async def ranked_documents(data_dict: Dict, size: int = FILTER_TOP_K, search_after: List = None):
+    """Return the `size` most relevant documents and the cursor for the next page (None on the last page)."""
+    if not data_dict.get('Keywords'):
+        return [], None
 
-    filtered_documents = es.search(index=document_index, body=query_map)
-    hits_list = filtered_documents['hits']['hits']
+    response = await es.search(index=document_index, body=build_ranked_query(data_dict, size, search_after))
+    hits_list = response['hits']['hits']
     data_list = [{
         "Document Id": hit['_id'],
         "Document Name": hit['_source']['Document Name'],
-        "Document path": hit['_source']['Document Source']
+        "Document path": hit['_source']['Document Source'],
+        "File Id": hit['_source'].get('File Id'),
+        "Score": hit['_score']
     } for hit in hits_list]
 
-    document_paths = [document["Document path"] for document in data_list]
+    next_cursor = hits_list[-1]['sort'] if len(hits_list) == size else None
+    return data_list, next_cursor
 
-    return document_paths
 
+@cl.step(name="Document filter Agent", root=True)
+async def filter_documents(data_dict: Dict, top_k: int = FILTER_TOP_K):
+    data_list, _ = await ranked_documents(data_dict, size=top_k)
+    return data_list
 
-@cl.step(name="Osiris", type="run", root=True)
-async def run(thread_id: str, human_query: str, file_ids: List[str] = []):
 
-    osiris_agent = await client.beta.assistants.retrieve(assistant_id)
+async def process_run_step(
+        thread_id: str,
+        step: RunStep,
+        message_references: Dict[str, cl.Message],
+        step_references: Dict[str, cl.Step],
+        function_outputs: Dict[str, Any],
+):
+    step_details = step.step_details
+    # Update step content in the Chainlit UI
+    if step_details.type == "message_creation":
+        # The message is only complete once its step is
+        if step.status != "completed":
+            return
+        thread_message = await client.beta.threads.messages.retrieve(
+            message_id=step_details.message_creation.message_id,
+            thread_id=thread_id,
+        )
+        await process_thread_message(message_references, thread_message)
+
+    if step_details.type == "tool_calls":
+        for tool_call in step_details.tool_calls:
+            if isinstance(tool_call, dict):
+                tool_call = DictToObject(tool_call)
+
+            if tool_call.type == "code_interpreter":
+                await process_tool_call(
+                    step_references=step_references,
+                    step=step,
+                    tool_call=tool_call,
+                    name=tool_call.type,
+                    input=tool_call.code_interpreter.input
+                          or "# Generating code",
+                    output=tool_call.code_interpreter.outputs,
+                    show_input="python",
+                )
+
+            elif tool_call.type == "retrieval":
+                await process_tool_call(
+                    step_references=step_references,
+                    step=step,
+                    tool_call=tool_call,
+                    name=tool_call.type,
+                    input="Retrieving information",
+                    output="Retrieved information",
+                )
+
+            elif tool_call.type == "function":
+                function_name = tool_call.function.name
+                function_args = json.loads(tool_call.function.arguments)
+
+                # A step waiting for its outputs is listed on every poll, call the function once
+                if tool_call.id not in function_outputs:
+                    function_outputs[tool_call.id] = tool_map[function_name](
+                        **function_args
+                    )
+
+                await process_tool_call(
+                    step_references=step_references,
+                    step=step,
+                    tool_call=tool_call,
+                    name=function_name,
+                    input=function_args,
+                    output=function_outputs[tool_call.id],
+                    show_input="json",
+                )
 
-    await client.beta.assistants.update(
-        assistant_id,
-        instructions=osiris_agent.instructions,
-        name=osiris_agent.name,
-        tools=[{"type": "retrieval"}],
-        model="gpt-4-turbo-preview",
-        file_ids=file_ids,
-    )
 
-    # Add the message to the thread
+@cl.step(name="Osiris", type="run", root=True)
+async def run(thread_id: str, human_query: str, file_ids: List[str] = []):
+
+    # Add the message to the thread, the documents are attached to it rather than to the shared
+    # assistant so concurrent chat sessions never overwrite each other's files
     init_message = await client.beta.threads.messages.create(
         thread_id=thread_id, role="user", content=human_query, file_ids=file_ids
     )
 
-    # Create the run
+    # Create the run, tools and model are set per run so the assistant itself is never modified
     run = await client.beta.threads.runs.create(
-        thread_id=thread_id, assistant_id=assistant_id
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        tools=[{"type": "retrieval"}],
+        model="gpt-4-turbo-preview",
     )
 
     message_references = {}  # type: Dict[str, cl.Message]
     step_references = {}  # type: Dict[str, cl.Step]
-    tool_outputs = []
+    function_outputs = {}  # type: Dict[str, Any]
+    rendered_steps = set()  # completed steps that are already shown in full
+    step_cursor = None  # last step that completed along with every step before it
+    poll_interval = RUN_POLL_INITIAL
     # Periodically check for updates
     while True:
         run = await client.beta.threads.runs.retrieve(
             thread_id=thread_id, run_id=run.id
         )
 
-        # Fetch the run steps
+        # Only fetch the steps after the cursor, completed ones are never fetched twice
+        cursor_args = {"after": step_cursor} if step_cursor else {}
         run_steps = await client.beta.threads.runs.steps.list(
-            thread_id=thread_id, run_id=run.id, order="asc"
+            thread_id=thread_id, run_id=run.id, order="asc", **cursor_args
         )
 
+        advance_cursor = True
         for step in run_steps.data:
-            # Fetch step details
-            run_step = await client.beta.threads.runs.steps.retrieve(
-                thread_id=thread_id, run_id=run.id, step_id=step.id
-            )
-            step_details = run_step.step_details
-            # Update step content in the Chainlit UI
-            if step_details.type == "message_creation":
-                thread_message = await client.beta.threads.messages.retrieve(
-                    message_id=step_details.message_creation.message_id,
-                    thread_id=thread_id,
-                )
-                await process_thread_message(message_references, thread_message)
-
-            if step_details.type == "tool_calls":
-                for tool_call in step_details.tool_calls:
-                    if isinstance(tool_call, dict):
-                        tool_call = DictToObject(tool_call)
-
-                    if tool_call.type == "code_interpreter":
-                        await process_tool_call(
-                            step_references=step_references,
-                            step=step,
-                            tool_call=tool_call,
-                            name=tool_call.type,
-                            input=tool_call.code_interpreter.input
-                                  or "# Generating code",
-                            output=tool_call.code_interpreter.outputs,
-                            show_input="python",
-                        )
-
-                        tool_outputs.append(
-                            {
-                                "output": tool_call.code_interpreter.outputs or "",
-                                "tool_call_id": tool_call.id,
-                            }
-                        )
-
-                    elif tool_call.type == "retrieval":
-                        await process_tool_call(
-                            step_references=step_references,
-                            step=step,
-                            tool_call=tool_call,
-                            name=tool_call.type,
-                            input="Retrieving information",
-                            output="Retrieved information",
-                        )
-
-                    elif tool_call.type == "function":
-                        function_name = tool_call.function.name
-                        function_args = json.loads(tool_call.function.arguments)
-
-                        function_output = tool_map[function_name](
-                            **json.loads(tool_call.function.arguments)
-                        )
-
-                        await process_tool_call(
-                            step_references=step_references,
-                            step=step,
-                            tool_call=tool_call,
-                            name=function_name,
-                            input=function_args,
-                            output=function_output,
-                            show_input="json",
-                        )
-
-                        tool_outputs.append(
-                            {"output": function_output, "tool_call_id": tool_call.id}
-                        )
-            if (
-                    run.status == "requires_action"
-                    and run.required_action.type == "submit_tool_outputs"
-            ):
-                await client.beta.threads.runs.submit_tool_outputs(
-                    thread_id=thread_id,
-                    run_id=run.id,
-                    tool_outputs=tool_outputs,
+            step_done = step.status in ["cancelled", "failed", "completed", "expired"]
+            if step.id not in rendered_steps:
+                await process_run_step(
+                    thread_id, step, message_references, step_references, function_outputs
                 )
+                if step_done:
+                    rendered_steps.add(step.id)
+            if advance_cursor and step_done:
+                step_cursor = step.id
+            else:
+                advance_cursor = False
+
+        if (
+                run.status == "requires_action"
+                and run.required_action.type == "submit_tool_outputs"
+        ):
+            tool_outputs = [
+                {"output": function_outputs.get(tool_call.id, ""), "tool_call_id": tool_call.id}
+                for tool_call in run.required_action.submit_tool_outputs.tool_calls
+            ]
+            await client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id,
+                run_id=run.id,
+                tool_outputs=tool_outputs,
+            )
 
-        await cl.sleep(2)  # Refresh every 2 seconds
         if run.status in ["cancelled", "failed", "completed", "expired"]:
             break
+        # Poll quickly at first so the first answer shows up early, then back off
+        await cl.sleep(poll_interval)
+        poll_interval = min(poll_interval * 1.5, RUN_POLL_MAX)
 
 
 @cl.on_message
 async def on_message(message_from_ui: cl.Message):
     thread = cl.user_session.get("thread")  # type: Thread
+    timer = TurnTimer()
     # files_ids = await process_files(message_from_ui.elements)
-    es_search_query = await search_documents(user_query=message_from_ui.content)
-    file_paths = await filter_documents(data_dict=es_search_query)
-    files_ids = await upload_files_from_path(file_paths)
-
-    await run(
-        thread_id=thread.id, human_query=message_from_ui.content, file_ids=files_ids
-    )
+    # Repeated questions reuse the routing and retrieval of an earlier turn against the same vocabulary
+    await vocabulary_cache.get()
+    cache_key = query_cache.key(message_from_ui.content, vocabulary_cache.version)
+    cached_result = query_cache.get(cache_key)
+    if cached_result is not None:
+        es_search_query, documents = cached_result
+    else:
+        with timer.stage("route"):
+            es_search_query = await search_documents(user_query=message_from_ui.content)
+        with timer.stage("filter"):
+            documents = await filter_documents(data_dict=es_search_query)
+        query_cache.put(cache_key, (es_search_query, documents))
+    with timer.stage("attach"):
+        files_ids = await resolve_file_ids(documents)
+
+    # Attachments can only be set when the message is created, so the run waits for the files
+    with timer.stage("run"):
+        try:
+            await run(
+                thread_id=thread.id, human_query=message_from_ui.content, file_ids=files_ids
+            )
+        except (BadRequestError, NotFoundError):
+            # A cached or indexed file id may point to a file deleted on the OpenAI side: upload it again once
+            stale_ids = await find_missing_file_ids(files_ids)
+            if not stale_ids:
+                raise
+            await replace_stale_file_ids(documents, stale_ids)
+            files_ids = await resolve_file_ids(documents)
+            await run(
+                thread_id=thread.id, human_query=message_from_ui.content, file_ids=files_ids
+            )
+    timings_logger.info("Turn timings for thread %s: %s", thread.id, timer)
 
 
 @cl.on_chat_resume
@@ -0,0 +1,41 @@
+import sys
+
+
+class ProgressReporter:
+    """
+    Receives the progress messages of the ingestion pipeline. This one prints them, which suits
+    command line and background runs; any object with the same methods can be passed instead.
+    """
+
+    def write(self, message):
+        print(message)
+
+    def info(self, message):
+        print(message)
+
+    def success(self, message):
+        print(message)
+
+    def error(self, message):
+        print(message, file=sys.stderr)
+
+
+class StreamlitReporter(ProgressReporter):
+    """Shows the progress messages in the Streamlit app."""
+
+    def __init__(self):
+        import streamlit as st
+
+        self.st = st
+
+    def write(self, message):
+        self.st.write(message)
+
+    def info(self, message):
+        self.st.info(message)
+
+    def success(self, message):
+        self.st.success(message)
+
+    def error(self, message):
+        self.st.error(message)
@@ -0,0 +1,51 @@
+import os
+import re
+import time
+from collections import OrderedDict
+
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 1000))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", 600))  # seconds
+
+
+def normalize_query(query):
+    """Case, whitespace and surrounding punctuation do not change which documents a question needs."""
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.strip(" ?!.,;:")
+
+
+class QueryCache:
+    """
+    LRU cache of routing and retrieval results for a question.
+
+    Keys combine the normalized question with the vocabulary version, so results computed against an
+    older vocabulary are never served once new documents have been indexed; entries also expire after `ttl`.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES, ttl=QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+
+    @staticmethod
+    def key(query, vocabulary_version):
+        return vocabulary_version, normalize_query(query)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from file_hashing import hash_file
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, uploads are then always written out
+    fcntl = None
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))  # bytes per write
+UPLOAD_BLOB_DIR = os.getenv("UPLOAD_BLOB_DIR", ".cache/uploads")
+UPLOAD_BLOB_TTL = int(os.getenv("UPLOAD_BLOB_TTL", 7 * 24 * 60 * 60))  # seconds a stored upload is kept unused
+UPLOAD_BLOB_PRUNE_INTERVAL = int(os.getenv("UPLOAD_BLOB_PRUNE_INTERVAL", 60 * 60))  # seconds between prunes
+
+_FICLONE = 0x40049409  # Linux ioctl creating a copy-on-write clone (btrfs, xfs)
+
+_last_prune = 0.0
+_prune_lock = threading.Lock()
+
+
+def reflink_file(source, destination):
+    """
+    Make `destination` a copy-on-write clone of `source`, sharing its data blocks until either is
+    written. Returns False, leaving no `destination` behind, when the filesystem cannot clone.
+    """
+    if fcntl is None:
+        return False
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return True
+    except OSError:
+        if os.path.exists(destination):
+            os.remove(destination)
+        return False
+
+
+def _usable_blob(blob_path, content_hash, size):
+    # Blobs are read-only clones, but check them anyway before trusting one with an upload
+    try:
+        if os.path.getsize(blob_path) != size or hash_file(blob_path) != content_hash:
+            os.remove(blob_path)
+            return False
+    except FileNotFoundError:
+        return False
+    os.utime(blob_path)  # keeps it from being pruned
+    return True
+
+
+def _store_blob(path, blob_path):
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    tmp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if reflink_file(path, tmp_path):
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, blob_path)
+
+
+def prune_blobs(blob_dir=UPLOAD_BLOB_DIR, max_age=UPLOAD_BLOB_TTL, interval=UPLOAD_BLOB_PRUNE_INTERVAL):
+    """Remove stored uploads unused for `max_age` seconds, at most once every `interval` seconds."""
+    global _last_prune
+    with _prune_lock:
+        now = time.time()
+        if now - _last_prune < interval or not os.path.isdir(blob_dir):
+            return
+        _last_prune = now
+    for entry in os.scandir(blob_dir):
+        if entry.is_file() and now - entry.stat().st_mtime > max_age:
+            os.remove(entry.path)
+
+
+def persist_upload(file, destination, blob_dir=UPLOAD_BLOB_DIR, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Save an in-memory upload to `destination` and return its sha256 hex digest.
+
+    The upload's buffer is hashed and written through a memoryview, so it is never copied in memory,
+    and the file appears atomically through a rename. On filesystems that support copy-on-write clones,
+    content uploaded before is cloned from the read-only store in `blob_dir` instead of being written
+    again; saved files never share blocks that an in-place write to one of them could change.
+    """
+    view = file.getbuffer()  # Streamlit's UploadedFile is a BytesIO, this exposes its memory without copying
+    try:
+        content_hash = hashlib.sha256(view).hexdigest()
+        if (os.path.exists(destination) and os.path.getsize(destination) == len(view)
+                and hash_file(destination) == content_hash):
+            return content_hash  # the same upload was saved here before
+
+        blob_path = os.path.join(blob_dir, content_hash)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(destination) or ".", prefix=".upload-")
+        os.close(fd)
+        try:
+            cloned = _usable_blob(blob_path, content_hash, len(view)) and reflink_file(blob_path, tmp_path)
+            if not cloned:
+                with open(tmp_path, "wb") as f:
+                    for start in range(0, len(view), chunk_size):
+                        f.write(view[start:start + chunk_size])
+                _store_blob(tmp_path, blob_path)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, destination)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    finally:
+        view.release()
+
+    prune_blobs(blob_dir)
+    return content_hash
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import threading
+import time
+
+VOCABULARY_CACHE_TTL = int(os.getenv("VOCABULARY_CACHE_TTL", 300))  # seconds between change checks
+VOCABULARY_CACHE_MAX_AGE = int(os.getenv("VOCABULARY_CACHE_MAX_AGE", 3600))  # seconds between full reloads
+
+keywords_query = {
+    "size": 0,
+    "aggs": {
+        "nested_metadata": {
+            "nested": {
+                "path": "Metadata"
+            },
+            "aggs": {
+                "unique_doc_keywords": {
+                    "terms": {
+                        "field": "Metadata.DOC_Keywords",
+                        "size": 10000
+                    }
+                }
+            }
+        }
+    }
+}
+
+domains_query = {
+    "size": 0,
+    "aggs": {
+        "nested_metadata": {
+            "nested": {
+                "path": "Metadata"
+            },
+            "aggs": {
+                "unique_domains": {
+                    "terms": {
+                        "field": "Metadata.Domain.keyword",
+                        "size": 10000
+                    }
+                }
+            }
+        }
+    }
+}
+
+
+def parse_keywords(keywords_response):
+    # Extract the list of unique document keywords from the response
+    return [bucket['key'] for bucket in
+            keywords_response['aggregations']['nested_metadata']['unique_doc_keywords']['buckets']]
+
+
+def parse_domains(domains_response):
+    # Extract the list of unique domains from the response
+    return [bucket['key'] for bucket in
+            domains_response['aggregations']['nested_metadata']['unique_domains']['buckets']]
+
+
+def fetch_unique_keywords(es, index):
+    return parse_keywords(es.search(index=index, body=keywords_query))
+
+
+def fetch_unique_domains(es, index):
+    return parse_domains(es.search(index=index, body=domains_query))
+
+
+async def fetch_vocabulary_async(es, index):
+    """Run both aggregations concurrently on an AsyncElasticsearch client."""
+    keywords_response, domains_response = await asyncio.gather(
+        es.search(index=index, body=keywords_query),
+        es.search(index=index, body=domains_query),
+    )
+    return parse_keywords(keywords_response), parse_domains(domains_response)
+
+
+class _VocabularySnapshot:
+    """State and reload policy shared by the sync and async vocabulary caches."""
+
+    def __init__(self, es, index, ttl=VOCABULARY_CACHE_TTL, max_age=VOCABULARY_CACHE_MAX_AGE):
+        self.es = es
+        self.index = index
+        self.ttl = ttl
+        self.max_age = max_age
+        self.keywords = []
+        self.domains = []
+        self.version = 0
+        self._doc_count = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._stale = False
+        self._refreshing = False
+
+    def invalidate(self):
+        """Mark the vocabulary stale, e.g. after a new document was indexed."""
+        self._stale = True
+
+    def _check_due(self):
+        return self._stale or time.monotonic() - self._checked_at > self.ttl
+
+    def _needs_reload(self, doc_count):
+        now = time.monotonic()
+        self._checked_at = now
+        unchanged = doc_count == self._doc_count and now - self._loaded_at < self.max_age
+        if self.version and unchanged and not self._stale:
+            return False
+        self._stale = False
+        return True
+
+    def _store(self, keywords, domains, doc_count):
+        self.keywords, self.domains = keywords, domains
+        self._doc_count = doc_count
+        self._loaded_at = self._checked_at
+        self.version += 1
+
+
+class VocabularyCache(_VocabularySnapshot):
+    """
+    In-memory copy of the unique document keywords and domains of an index.
+
+    The vocabulary is loaded once and then served from memory. After `ttl` seconds a background
+    refresh checks the document count and only re-runs the aggregations when it changed, when the
+    cache was invalidated by a local write, or when the copy is older than `max_age`.
+    `version` increases every time the vocabulary is reloaded.
+    """
+
+    def __init__(self, es, index, ttl=VOCABULARY_CACHE_TTL, max_age=VOCABULARY_CACHE_MAX_AGE):
+        super().__init__(es, index, ttl=ttl, max_age=max_age)
+        self._refresh_lock = threading.Lock()
+
+    def get(self):
+        """Return (keywords, domains); only the very first call waits for Elasticsearch."""
+        if self.version == 0:
+            self.refresh()
+        elif self._check_due():
+            self.refresh_in_background()
+        return self.keywords, self.domains
+
+    def refresh_in_background(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Vocabulary refresh failed: {e}")
+        finally:
+            self._refreshing = False
+
+    def refresh(self):
+        """Reload the vocabulary if the index changed; returns True when it was reloaded."""
+        with self._refresh_lock:
+            doc_count = self.es.count(index=self.index)["count"]
+            if not self._needs_reload(doc_count):
+                return False
+            keywords = fetch_unique_keywords(self.es, self.index)
+            domains = fetch_unique_domains(self.es, self.index)
+            self._store(keywords, domains, doc_count)
+            return True
+
+
+class AsyncVocabularyCache(_VocabularySnapshot):
+    """VocabularyCache for an AsyncElasticsearch client, refreshing in event loop tasks instead of threads."""
+
+    def __init__(self, es, index, ttl=VOCABULARY_CACHE_TTL, max_age=VOCABULARY_CACHE_MAX_AGE):
+        super().__init__(es, index, ttl=ttl, max_age=max_age)
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task = None
+
+    async def get(self):
+        """Return (keywords, domains); only the very first call waits for Elasticsearch."""
+        if self.version == 0:
+            await self.refresh()
+        elif self._check_due():
+            self.refresh_in_background()
+        return self.keywords, self.domains
+
+    def refresh_in_background(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+        # Keep a reference so the task is not garbage collected while it runs
+        self._refresh_task = asyncio.create_task(self._background_refresh())
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"Vocabulary refresh failed: {e}")
+        finally:
+            self._refreshing = False
+
+    async def refresh(self):
+        """Reload the vocabulary if the index changed; returns True when it was reloaded."""
+        async with self._refresh_lock:
+            doc_count = (await self.es.count(index=self.index))["count"]
+            if not self._needs_reload(doc_count):
+                return False
+            keywords, domains = await fetch_vocabulary_async(self.es, self.index)
+            self._store(keywords, domains, doc_count)
+            return True
@@ -0,0 +1,139 @@
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+VOCABULARY_EMBEDDING_FEATURES = int(os.getenv("VOCABULARY_EMBEDDING_FEATURES", 1024))
+KEYWORD_SHORTLIST_SIZE = int(os.getenv("KEYWORD_SHORTLIST_SIZE", 50))
+DOMAIN_SHORTLIST_SIZE = int(os.getenv("DOMAIN_SHORTLIST_SIZE", 10))
+# Cosine similarity above which a keyword/domain is considered named by the query itself
+VOCABULARY_RESOLVE_THRESHOLD = float(os.getenv("VOCABULARY_RESOLVE_THRESHOLD", 0.9))
+
+_token_pattern = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Local text embedder: word and character n-gram features hashed into a fixed-size vector,
+    weighted by IDF over the fitted vocabulary and L2 normalised. Needs no model and no network.
+    """
+
+    def __init__(self, n_features=VOCABULARY_EMBEDDING_FEATURES, char_ngrams=(3, 4)):
+        self.n_features = n_features
+        self.char_ngrams = char_ngrams
+        self.idf = np.ones(n_features, dtype=np.float32)
+
+    def _features(self, text):
+        words = _token_pattern.findall(text.lower())
+        features = ["w:" + word for word in words]
+        for word in words:
+            padded = f"#{word}#"
+            for n in self.char_ngrams:
+                features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def _hashed(self, text):
+        indices = []
+        signs = []
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            indices.append(h % self.n_features)
+            # Signed hashing keeps collisions from systematically inflating similarities
+            signs.append(1.0 if (h >> 31) & 1 else -1.0)
+        return np.asarray(indices, dtype=np.int64), np.asarray(signs, dtype=np.float32)
+
+    def fit(self, texts):
+        document_frequency = np.zeros(self.n_features, dtype=np.float32)
+        for text in texts:
+            indices, _ = self._hashed(text)
+            document_frequency[np.unique(indices)] += 1
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        return self
+
+    def transform(self, texts):
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            indices, signs = self._hashed(text)
+            np.add.at(matrix[row], indices, signs)
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+def query_windows(query, max_words=3):
+    """The query itself plus every run of up to `max_words` consecutive words in it."""
+    words = _token_pattern.findall(query)
+    windows = [query]
+    for size in range(1, max_words + 1):
+        windows.extend(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return windows
+
+
+class TermIndex:
+    """Vectorised cosine-similarity index over a list of short terms."""
+
+    def __init__(self, terms, embedder=None):
+        self.terms = list(terms)
+        self.embedder = embedder or HashingEmbedder()
+        self.embedder.fit(self.terms)
+        self.vectors = self.embedder.transform(self.terms)
+
+    def search(self, query, k):
+        """Return the top `k` (term, score) pairs, best first."""
+        if not self.terms:
+            return []
+        # A term matches the query if it matches any short phrase of it, so long questions do not dilute the score
+        query_vectors = self.embedder.transform(query_windows(query))
+        scores = (query_vectors @ self.vectors.T).max(axis=0)
+        k = min(k, len(self.terms))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.terms[i], float(scores[i])) for i in top]
+
+
+class VocabularyIndex:
+    """
+    Keyword and domain term indexes built from a (sync or async) vocabulary cache and rebuilt
+    whenever the cache reloads the vocabulary. It serves what the cache currently holds, so the
+    caller loads the cache first.
+    """
+
+    def __init__(self, vocabulary_cache):
+        self.vocabulary_cache = vocabulary_cache
+        self.version = None
+        self.keywords = TermIndex([])
+        self.domains = TermIndex([])
+        self._lock = threading.Lock()
+
+    def _current(self):
+        cache = self.vocabulary_cache
+        with self._lock:
+            if self.version != cache.version:
+                version, keywords, domains = cache.version, cache.keywords, cache.domains
+                self.keywords = TermIndex(keywords)
+                self.domains = TermIndex(domains)
+                self.version = version
+            return self.keywords, self.domains
+
+    def shortlist(self, query, keyword_k=KEYWORD_SHORTLIST_SIZE, domain_k=DOMAIN_SHORTLIST_SIZE):
+        """Return the best (term, score) candidates for the query as {"Keywords": [...], "Domains": [...]}."""
+        keyword_index, domain_index = self._current()
+        return {
+            "Keywords": keyword_index.search(query, keyword_k),
+            "Domains": domain_index.search(query, domain_k),
+        }
+
+
+def resolve_shortlist(shortlist, threshold=VOCABULARY_RESOLVE_THRESHOLD):
+    """
+    Pick keywords and domains straight from the shortlist when the query names them explicitly.
+    Returns None when either side has no confident match and the LLM has to decide.
+    """
+    resolved = {key: [term for term, score in candidates if score >= threshold]
+                for key, candidates in shortlist.items()}
+    if resolved["Keywords"] and resolved["Domains"]:
+        return resolved
+    return None